@@ -0,0 +1,317 @@
+import io
+import os
+import sys
+import shutil
+import json
+import time
+import socket
+import ftplib
+import logging
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from pathlib import Path
+
+USER, PASSWORD = "joel", "joel"
+BLOCK = 1024 * 1024  # Bloque con el que se generan los archivos de prueba
+
+def run_server(base_dir, port, options):
+    """Proceso hijo: ServerFTP en loopback sobre el directorio temporal"""
+    logging.basicConfig(level=logging.WARNING)
+    from server import ServerFTP
+    server = ServerFTP("127.0.0.1", port, **options)
+    server.base_dir = Path(base_dir)
+    server.start()
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def percentile(values, p):
+    """Percentil p (0-100) por rango más cercano"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def latency_summary(samples):
+    """Resumen de latencias en milisegundos"""
+    return {"count": len(samples),
+            "p50_ms": percentile(samples, 50) * 1000 if samples else None,
+            "p99_ms": percentile(samples, 99) * 1000 if samples else None,
+            "max_ms": max(samples) * 1000 if samples else None}
+
+def peak_rss_kb(pid):
+    """Pico de memoria residente (VmHWM) de un proceso, en KiB; None si no está disponible"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def make_file(path, size):
+    """Crea un archivo de size bytes repitiendo un bloque aleatorio"""
+    block = os.urandom(min(size, BLOCK))
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining:
+            n = min(remaining, len(block))
+            f.write(block[:n])
+            remaining -= n
+
+def connect(port):
+    ftp = ftplib.FTP()
+    ftp.connect("127.0.0.1", port)
+    ftp.login(USER, PASSWORD)
+    ftp.voidcmd("TYPE I")
+    return ftp
+
+def timed(samples, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    samples.append(time.perf_counter() - start)
+    return result
+
+def retr(ftp, name, buffer):
+    """Descarga descartando los datos; devuelve los bytes recibidos"""
+    received = 0
+    with ftp.transfercmd(f"RETR {name}") as data:
+        while True:
+            n = data.recv_into(buffer)
+            if not n:
+                break
+            received += n
+    ftp.voidresp()
+    return received
+
+def stor(ftp, name, path):
+    with ftp.transfercmd(f"STOR {name}") as data, open(path, "rb") as f:
+        sent = data.sendfile(f)
+    ftp.voidresp()
+    return sent
+
+def list_dir(ftp, path, buffer):
+    received = 0
+    with ftp.transfercmd(f"LIST {path}") as data:
+        while True:
+            n = data.recv_into(buffer)
+            if not n:
+                break
+            received += n
+    ftp.voidresp()
+    return received
+
+def transfer_scenario(ftp, base_dir, label, size, count, direction, buffer):
+    """RETR o STOR de count archivos de size bytes: throughput y latencia por archivo"""
+    source = base_dir / f"{label}.src"
+    make_file(source, size)
+    samples = []
+    start = time.perf_counter()
+    for i in range(count):
+        if direction == "RETR":
+            timed(samples, retr, ftp, source.name, buffer)
+        else:
+            timed(samples, stor, ftp, f"{label}.{i}.up", source)
+    elapsed = time.perf_counter() - start
+    for i in range(count if direction == "STOR" else 0):
+        (base_dir / f"{label}.{i}.up").unlink()
+    source.unlink()
+    total = size * count
+    return {"files": count, "bytes": total, "seconds": elapsed,
+            "throughput_mb_s": total / elapsed / 1e6 if elapsed else None,
+            "latency": latency_summary(samples)}
+
+def list_scenario(ftp, base_dir, entries, repeat, buffer):
+    """LIST de un directorio con entries archivos: la primera vez en frío, luego con caché"""
+    directory = base_dir / f"list_{entries}"
+    directory.mkdir()
+    for i in range(entries):
+        (directory / f"f{i:06d}").touch()
+    samples = []
+    received = 0
+    for _ in range(repeat):
+        received = timed(samples, list_dir, ftp, directory.name, buffer)
+    return {"entries": entries, "listing_bytes": received,
+            "cold_ms": samples[0] * 1000, "warm": latency_summary(samples[1:])}
+
+def latency_scenario(ftp, count):
+    """Latencia de comandos de control sin transferencia"""
+    samples = {"NOOP": [], "PWD": [], "SIZE": []}
+    ftp.storbinary("STOR latency.txt", io.BytesIO(b"x"))
+    for _ in range(count):
+        timed(samples["NOOP"], ftp.voidcmd, "NOOP")
+        timed(samples["PWD"], ftp.pwd)
+        timed(samples["SIZE"], ftp.size, "latency.txt")
+    ftp.delete("latency.txt")
+    all_samples = [s for values in samples.values() for s in values]
+    return {"commands": {cmd: latency_summary(values) for cmd, values in samples.items()},
+            "all": latency_summary(all_samples)}
+
+def concurrent_scenario(port, base_dir, sessions, iterations, file_size):
+    """sessions sesiones en paralelo con una mezcla de comandos y transferencias pequeñas"""
+    directory = base_dir / "mixed"
+    directory.mkdir()
+    for i in range(100):
+        (directory / f"f{i:03d}").touch()
+    source = base_dir / "mixed.src"
+    make_file(source, file_size)
+    samples = {"NOOP": [], "PWD": [], "LIST": [], "RETR": [], "STOR": []}
+    lock = threading.Lock()
+    errors = []
+
+    def session(n):
+        local = {cmd: [] for cmd in samples}
+        buffer = memoryview(bytearray(256 * 1024))
+        try:
+            ftp = connect(port)
+            for i in range(iterations):
+                timed(local["NOOP"], ftp.voidcmd, "NOOP")
+                timed(local["PWD"], ftp.pwd)
+                timed(local["LIST"], list_dir, ftp, directory.name, buffer)
+                timed(local["RETR"], retr, ftp, source.name, buffer)
+                timed(local["STOR"], stor, ftp, f"mixed.{n}.up", source)
+            ftp.quit()
+        except (OSError, ftplib.Error) as e:
+            errors.append(str(e))
+        with lock:
+            for cmd, values in local.items():
+                samples[cmd].extend(values)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(n,)) for n in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    operations = sum(len(values) for values in samples.values())
+    moved = (len(samples["RETR"]) + len(samples["STOR"])) * file_size
+    all_samples = [s for values in samples.values() for s in values]
+    return {"sessions": sessions, "iterations": iterations, "seconds": elapsed,
+            "operations_per_second": operations / elapsed if elapsed else None,
+            "throughput_mb_s": moved / elapsed / 1e6 if elapsed else None,
+            "errors": errors,
+            "commands": {cmd: latency_summary(values) for cmd, values in samples.items()},
+            "all": latency_summary(all_samples)}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def run(args):
+    base_dir = Path(tempfile.mkdtemp(prefix="ftp_bench_"))
+    port = free_port()
+    options = {"event_loop": args.event_loop}
+    server = multiprocessing.Process(target=run_server, args=(str(base_dir), port, options), daemon=True)
+    server.start()
+    # Espera a que el servidor acepte conexiones
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+    result = {"meta": {"commit": git_commit(), "python": platform.python_version(),
+                       "platform": platform.platform(), "timestamp": time.time(),
+                       "parameters": vars(args)},
+              "scenarios": {}}
+    scenarios = result["scenarios"]
+    buffer = memoryview(bytearray(256 * 1024))
+
+    def record(name, function, *function_args):
+        print(f"Escenario {name}...", file=sys.stderr, flush=True)
+        scenarios[name] = function(*function_args)
+        scenarios[name]["server_peak_rss_kb"] = peak_rss_kb(server.pid)
+
+    try:
+        ftp = connect(port)
+        record("latency", latency_scenario, ftp, args.latency_commands)
+        for label, size, count in (("small", args.small_kb * 1024, args.small_files),
+                                   ("medium", args.medium_mb * 1024 * 1024, 3),
+                                   ("large", args.large_mb * 1024 * 1024, 1)):
+            if size:
+                record(f"retr_{label}", transfer_scenario, ftp, base_dir, label, size, count, "RETR", buffer)
+                record(f"stor_{label}", transfer_scenario, ftp, base_dir, label, size, count, "STOR", buffer)
+        for entries in args.list_entries:
+            record(f"list_{entries}", list_scenario, ftp, base_dir, entries, args.list_repeat, buffer)
+        ftp.quit()
+        record("concurrent", concurrent_scenario, port, base_dir, args.sessions, args.iterations,
+               args.small_kb * 1024)
+    finally:
+        server.terminate()
+        server.join()
+        # Pico de memoria de todo el proceso servidor una vez terminado
+        result["server_peak_rss_kb"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        if not args.keep:
+            shutil.rmtree(base_dir, ignore_errors=True)
+    return result
+
+def compare(baseline, current):
+    """Líneas con la variación de las métricas principales entre dos ejecuciones"""
+    lines = []
+    for name, scenario in current["scenarios"].items():
+        old = baseline["scenarios"].get(name)
+        if not old:
+            continue
+        for key in ("throughput_mb_s", "operations_per_second"):
+            if scenario.get(key) and old.get(key):
+                lines.append(f"{name} {key}: {old[key]:.2f} -> {scenario[key]:.2f} ({(scenario[key] / old[key] - 1) * 100:+.1f}%)")
+        for group in ("latency", "all", "warm"):
+            new_p99, old_p99 = (scenario.get(group) or {}).get("p99_ms"), (old.get(group) or {}).get("p99_ms")
+            if new_p99 and old_p99:
+                lines.append(f"{name} {group} p99: {old_p99:.3f} -> {new_p99:.3f} ms ({(new_p99 / old_p99 - 1) * 100:+.1f}%)")
+    return lines
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de ServerFTP en loopback (resultado en JSON)")
+    parser.add_argument("--event-loop", action="store_true", help="Servidor en modo bucle de eventos")
+    parser.add_argument("--small-kb", type=int, default=4, help="Tamaño de los archivos pequeños")
+    parser.add_argument("--small-files", type=int, default=200, help="Cantidad de archivos pequeños")
+    parser.add_argument("--medium-mb", type=int, default=64, help="Tamaño del archivo mediano")
+    parser.add_argument("--large-mb", type=int, default=2048, help="Tamaño del archivo grande (0 para omitirlo)")
+    parser.add_argument("--list-entries", type=lambda v: [int(n) for n in v.split(",")],
+                        default=[10, 1000, 100000], help="Entradas de los directorios de LIST, separadas por comas")
+    parser.add_argument("--list-repeat", type=int, default=5, help="Repeticiones de cada LIST")
+    parser.add_argument("--latency-commands", type=int, default=1000, help="Repeticiones de NOOP/PWD/SIZE")
+    parser.add_argument("--sessions", type=int, default=32, help="Sesiones simultáneas del escenario mixto")
+    parser.add_argument("--iterations", type=int, default=20, help="Iteraciones por sesión del escenario mixto")
+    parser.add_argument("--quick", action="store_true", help="Tamaños reducidos para una comprobación rápida")
+    parser.add_argument("--keep", action="store_true", help="No borrar el directorio temporal")
+    parser.add_argument("-o", "--output", help="Archivo JSON de salida (por defecto stdout)")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior con el que comparar")
+    args = parser.parse_args()
+    if args.quick:
+        args.small_files, args.medium_mb, args.large_mb = 50, 16, 0
+        args.list_entries, args.latency_commands = [10, 1000], 200
+        args.sessions, args.iterations = 8, 5
+
+    # El servidor se importa desde este mismo directorio
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    result = run(args)
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(json.load(f), result):
+                print(line, file=sys.stderr)
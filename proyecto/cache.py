@@ -0,0 +1,134 @@
+import os
+import stat
+import threading
+from collections import OrderedDict
+
+class ListingCache:
+    """
+    Caché LRU compartida de listados de directorio.
+    Cada entrada se construye una sola vez con os.scandir y se valida con el mtime
+    del directorio, que cambia cuando se crea, borra o renombra una entrada.
+    """
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # ruta -> (mtime_ns, ((nombre, es_archivo), ...))
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def listing(self, path):
+        """Devuelve las entradas del directorio como tuplas (nombre, es_archivo)"""
+        key = os.fspath(path)
+        mtime = os.stat(key).st_mtime_ns
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == mtime:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # is_file() usa el tipo que devuelve scandir y evita un stat por entrada
+        with os.scandir(key) as it:
+            entries = tuple((e.name, e.is_file()) for e in it)
+
+        with self.lock:
+            self.entries[key] = (mtime, entries)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entries
+
+    def invalidate(self, path, recursive=False):
+        """Descarta el listado de un directorio y, si se pide, el de sus subdirectorios"""
+        key = os.fspath(path)
+        with self.lock:
+            self.entries.pop(key, None)
+            if recursive:
+                prefix = key.rstrip(os.sep) + os.sep
+                for stale in [k for k in self.entries if k.startswith(prefix)]:
+                    del self.entries[stale]
+
+    def stats(self):
+        """Devuelve el uso actual de la caché"""
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+class ContentCache:
+    """
+    Caché LRU del contenido de archivos pequeños que se piden muy a menudo con RETR.
+    El límite es en bytes y cada archivo tiene un tamaño máximo para entrar. Cada
+    entrada se valida con inodo, fecha de modificación y tamaño, y el contenido se
+    guarda como bytes inmutables que comparten todas las sesiones.
+    """
+    def __init__(self, max_bytes, max_file_size=256 * 1024):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.entries = OrderedDict()  # ruta -> ((inodo, mtime_ns, tamaño), contenido)
+        self.size = 0  # Bytes ocupados por el contenido guardado
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path):
+        """
+        Devuelve el contenido del archivo desde la caché o lo carga si cabe.
+        Devuelve None si no es un archivo regular o si es demasiado grande para la caché.
+        """
+        key = os.path.normpath(path)
+        try:
+            st = os.stat(key)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode) or st.st_size > self.max_file_size:
+            return None
+        version = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        try:
+            with open(key, "rb") as f:
+                # La versión se toma del archivo abierto, que es el que se lee
+                st = os.fstat(f.fileno())
+                data = f.read(self.max_file_size + 1)
+        except OSError:
+            return None
+        version = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if len(data) != st.st_size:
+            # El archivo cambió durante la lectura: se sirve el disco sin guardar nada
+            return None
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old:
+                self.size -= len(old[1])
+            self.entries[key] = (version, data)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+        return data
+
+    def invalidate(self, path, recursive=False):
+        """Descarta el contenido de un archivo y, si se pide, el de todo lo que hay debajo de path"""
+        key = os.path.normpath(path)
+        with self.lock:
+            stale = [key] if key in self.entries else []
+            if recursive:
+                prefix = key.rstrip(os.sep) + os.sep
+                stale.extend(k for k in self.entries if k.startswith(prefix))
+            for k in stale:
+                self.size -= len(self.entries.pop(k)[1])
+
+    def stats(self):
+        """Devuelve el uso actual de la caché"""
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.size, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
@@ -3,31 +3,129 @@ import ssl
 import argparse
 import json
 import re
+import os
+import sys
+import shlex
+import codecs
+import select
+import tempfile
+import threading
+import weakref
+import ftp_reply
+import transfer
+import tls
 
-def connect_to_server(server, port, use_tls=False):
+def connect_to_server(server, port, reporter, use_tls=False, cafile=None):
     """
-    Conecta al servidor FTP.
-    Si use_tls es True, establece una conexión segura (TLS/SSL).
+    Conecta al servidor FTP y recibe el mensaje de bienvenida.
+    Si use_tls es True, protege la sesión con TLS explícito (AUTH TLS, PBSZ y PROT P)
+    antes de enviar las credenciales.
     """
     client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     client_socket.connect((server, port))
 
-    if use_tls:
-        # Configura el contexto SSL
-        context = ssl.create_default_context()
-        tls_socket = context.wrap_socket(client_socket, server_hostname=server)
-        return tls_socket
-    else:
+    # Recibe el mensaje de bienvenida del servidor
+    reporter.response(read_response(client_socket))
+    if not use_tls:
         return client_socket
 
+    try:
+        auth_response = send_command(client_socket, "AUTH TLS\r\n")
+        reporter.response(auth_response)
+        if json.loads(auth_response)["status"] != "234":
+            raise ConnectionError("El servidor no aceptó AUTH TLS")
+
+        # Configura el contexto SSL y negocia TLS sobre la conexión existente
+        context = tls.client_context(cafile)
+        tls_socket = context.wrap_socket(client_socket, server_hostname=server)
+    except Exception:
+        client_socket.close()
+        raise
+
+    # Las conexiones de datos también irán protegidas
+    for reply in ftp_reply.pipeline(tls_socket, ["PBSZ 0", "PROT P"]):
+        reporter.response(reply_json(reply))
+    return tls_socket
+
+def open_data_socket(client_socket, server, ip, port):
+    """Abre la conexión de datos; si la de control usa TLS, la protege reanudando su sesión"""
+    data_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    data_socket.connect((ip, port))
+    if isinstance(client_socket, ssl.SSLSocket):
+        return tls.wrap_data_socket(client_socket, data_socket, server)
+    return data_socket
+
+# Tipo de representación (TYPE) de cada conexión de control; el servidor empieza en A
+_types = weakref.WeakKeyDictionary()
+
+def transfer_type(client_socket):
+    return _types.get(client_socket, "A")
+
+# Modo de transmisión (MODE) de cada conexión de control; el servidor empieza en S
+_modes = weakref.WeakKeyDictionary()
+
+def transfer_mode(client_socket):
+    return _modes.get(client_socket, "S")
+
+def receive_data(data_socket, out, buffer, block_mode=False):
+    """Recibe un archivo en modo stream (hasta que el servidor cierra) o en modo bloque (hasta el bloque EOF)"""
+    if block_mode:
+        return transfer.receive_file_blocks(data_socket, out, buffer)
+    return transfer.receive_file(data_socket, out, buffer)
+
 def send_command(client_socket, command):
     """
     Envía un comando al servidor FTP y devuelve la respuesta en formato JSON.
     """
     client_socket.sendall(command.encode())
-    response = client_socket.recv(1024).decode().strip()
-    status_code = response.split(" ")[0]  # Extrae el código de estado
-    return json.dumps({"status": status_code, "message": response}, indent=4)
+    return read_response(client_socket)
+
+def read_response(client_socket):
+    """
+    Lee la siguiente respuesta completa del servidor (de una o varias líneas)
+    y la devuelve en formato JSON.
+    """
+    return reply_json(ftp_reply.reader_for(client_socket).read_reply())
+
+def reply_json(reply):
+    """Serializa una respuesta del servidor en el formato JSON del cliente"""
+    return json.dumps({"status": reply.code, "message": reply.text}, indent=4)
+
+class Reporter:
+    """
+    Destino de las respuestas de un comando. En modo normal las imprime a medida que
+    llegan; en modo por lotes las acumula para emitir un único resultado JSON por comando.
+    """
+    def __init__(self, collect=False, out=None):
+        self.collect = collect
+        self.out = out  # Salida de las respuestas; stdout si es None
+        self.responses = []
+        self.output = []
+
+    def response(self, response):
+        """Registra una respuesta del servidor ya serializada en JSON"""
+        if self.collect:
+            self.responses.append(json.loads(response))
+        else:
+            print(response, file=self.out)
+
+    def text(self, text, end="\n"):
+        """Registra texto que no es una respuesta (contenido de archivos, avisos)"""
+        if self.collect:
+            self.output.append(text + end)
+        else:
+            print(text, end=end, file=self.out)
+
+    def progress(self, total):
+        """Informe de avance de una transferencia; en modo por lotes no se muestra"""
+        return None if self.collect else transfer.Progress(total)
+
+    def result(self, command):
+        """Resultado acumulado de un comando en modo por lotes"""
+        result = {"command": command, "responses": self.responses}
+        if self.output:
+            result["output"] = "".join(self.output)
+        return result
 
 def parse_pasv_response(response, server_ip):
     """
@@ -41,65 +139,452 @@ def parse_pasv_response(response, server_ip):
         return ip, port
     return server_ip, None  # Usa la dirección IP del servidor si la respuesta no es válida
 
-def stor_retr_files(command, pasv_response, server, client_socket, argument1,argument2):
+def remote_size(client_socket, remote_name):
+    """Tamaño de un archivo remoto según SIZE, o None si el servidor no lo informa"""
+    size_response = json.loads(send_command(client_socket, f"SIZE {remote_name}\r\n"))
+    if size_response["status"] != "213":
+        return None
+    return int(size_response["message"].split()[1])
+
+def restart_offset(client_socket, remote_name, local_path, reporter):
+    """
+    Si existe una copia parcial local del archivo, pide al servidor reanudar la descarga
+    desde su tamaño (REST) y devuelve el desplazamiento. Devuelve 0 si hay que empezar de cero.
+    """
+    if not local_path or not os.path.isfile(local_path):
+        return 0
+    offset = os.path.getsize(local_path)
+
+    # Solo se reanuda si la copia local es un prefijo posible del archivo remoto
+    size = remote_size(client_socket, remote_name)
+    if size is None or offset == 0 or offset > size:
+        return 0
+
+    rest_response = send_command(client_socket, f"REST {offset}\r\n")
+    reporter.response(rest_response)
+    return offset if "350" in rest_response else 0
+
+class ReporterWriter:
+    """Archivo de solo escritura que entrega al reporter el texto recibido, decodificando por partes"""
+    def __init__(self, reporter):
+        self.reporter = reporter
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def write(self, data):
+        self.reporter.text(self.decoder.decode(data), end="")
+        return len(data)
+
+    def finish(self):
+        self.reporter.text(self.decoder.decode(b"", final=True), end="")
+
+def receive_to_reporter(data_socket, buffer, reporter, text_mode=False, block_mode=False):
+    """Recibe un archivo de texto y lo entrega al reporter, decodificando por partes"""
+    writer = ReporterWriter(reporter)
+    # En TYPE A las líneas llegan con CRLF
+    out = transfer.AsciiWriter(writer, b"\n") if text_mode else writer
+    received = receive_data(data_socket, out, buffer, block_mode)
+    if text_mode:
+        out.finish()
+    writer.finish()
+    return received
+
+def stor_retr_files(command, pasv_response, server, client_socket, argument1, argument2, reporter,
+                    chunk_size=transfer.CHUNK_SIZE, verify_size=False):
     if "227" in pasv_response:  # Código 227: Entrando en modo pasivo
         ip, port = parse_pasv_response(pasv_response, server)  # Pasa la dirección IP del servidor
         if ip and port:
             # Establece la conexión de datos
-            data_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            data_socket.connect((ip, port))
+            data_socket = open_data_socket(client_socket, server, ip, port)
+
+            # En TYPE A los finales de línea se convierten; en I los bytes pasan tal cual
+            text_mode = transfer_type(client_socket) == "A"
+            # En MODE B los datos van en bloques y el fin lo marca un bloque EOF
+            block_mode = transfer_mode(client_socket) == "B"
 
             if command == "RETR":
+                # argument2 es el archivo local destino; "-" escribe los bytes tal cual en stdout
+                to_stdout = argument2 == "-" and not reporter.collect
+                to_file = argument2 and argument2 != "-"
+
+                # Si se indicó un archivo local con una descarga parcial, se reanuda.
+                # En TYPE A los tamaños local y remoto no coinciden: ni se reanuda ni se verifica
+                offset = restart_offset(client_socket, argument1, argument2, reporter) if to_file and not text_mode else 0
+                size = remote_size(client_socket, argument1) if verify_size and not text_mode else None
+
                 # Ejecuta el comando RETR
                 retr_response = send_command(client_socket, f"RETR {argument1}\r\n")
-                print(retr_response)
+                reporter.response(retr_response)
+                if "150" not in retr_response:
+                    data_socket.close()
+                    return
 
-                # Recibe los datos del archivo
-                file_data = data_socket.recv(1024)
-                while file_data:
-                    print(file_data.decode(), end="")
-                    file_data = data_socket.recv(1024)
+                # Recibe los datos sobre un único buffer reutilizable
+                buffer = memoryview(bytearray(chunk_size))
+                if to_file:
+                    with open(argument2, "ab" if offset else "wb") as f:
+                        out = transfer.AsciiWriter(f) if text_mode else f
+                        received = receive_data(data_socket, out, buffer, block_mode)
+                        if text_mode:
+                            out.finish()
+                elif to_stdout:
+                    out = transfer.AsciiWriter(sys.stdout.buffer) if text_mode else sys.stdout.buffer
+                    received = receive_data(data_socket, out, buffer, block_mode)
+                    if text_mode:
+                        out.finish()
+                    sys.stdout.buffer.flush()
+                else:
+                    received = receive_to_reporter(data_socket, buffer, reporter, text_mode, block_mode)
 
                 # Cierra la conexión de datos
                 data_socket.close()
 
                 # Agrega verificación del mensaje 226
-                completion_response = client_socket.recv(1024).decode().strip()
-                print(json.dumps({"status": completion_response.split(" ")[0], "message": completion_response}, indent=4))
+                reporter.response(read_response(client_socket))
+
+                if size is not None and offset + received != size:
+                    reporter.response(json.dumps({"status": "500", "message": f"Descarga incompleta: {offset + received} de {size} bytes"}, indent=4))
+                elif verify_size and size is None and not text_mode:
+                    reporter.response(json.dumps({"status": "500", "message": "No se pudo verificar el tamaño: el servidor no respondió a SIZE"}, indent=4))
                 
-            elif command == "STOR":
-                # Ejecuta el comando STOR
-                stor_response = send_command(client_socket, f"STOR {argument2}\r\n")
-                print(stor_response)
+            elif command in LISTING_COMMANDS:
+                # argument1 es la ruta remota a listar, opcional
+                list_response = send_command(client_socket, build_command(command, argument1, None))
+                reporter.response(list_response)
+                if "150" not in list_response:
+                    data_socket.close()
+                    return
+
+                # El listado siempre llega con líneas terminadas en CRLF, sea cual sea el TYPE
+                buffer = memoryview(bytearray(chunk_size))
+                receive_to_reporter(data_socket, buffer, reporter, True, block_mode)
+                data_socket.close()
+                reporter.response(read_response(client_socket))
+
+            elif command in UPLOAD_COMMANDS:
+                # argument1 es el archivo local y argument2 el nombre remoto (STOU lo elige el servidor)
+                remote_name = None if command == "STOU" else argument2
+                stor_response = send_command(client_socket, build_command(command, remote_name, None))
+                reporter.response(stor_response)
 
                 # Verificación adicional antes de enviar datos
                 if "150" in stor_response:
-                    print("Enviando archivo...")
-                    
-                    # Abre el archivo para leer y enviarlo al servidor
+                    # Envía el archivo sin cargarlo en memoria, con copia cero cuando se puede
                     with open(argument1, "rb") as f:
-                        file_data = f.read(1024)
-                        while file_data:
-                            data_socket.sendall(file_data)
-                            file_data = f.read(1024)
-                            print("Enviando chunk de datos...")
-
-                    # Cierra la conexión de datos
-                    data_socket.shutdown(socket.SHUT_WR)
-                    data_socket.close()
+                        progress = reporter.progress(os.fstat(f.fileno()).st_size)
+                        source = transfer.AsciiReader(f) if text_mode else f
+                        if block_mode:
+                            transfer.send_file_blocks(data_socket, source, progress=progress)
+                        else:
+                            transfer.send_file(data_socket, source, chunk_size=chunk_size, progress=progress,
+                                               zero_copy=not text_mode)
+                    if progress:
+                        progress.finish()
 
-                    # Agrega verificación del mensaje 226
-                    completion_response = client_socket.recv(1024).decode().strip()
-                    print(json.dumps({"status": completion_response.split(" ")[0], "message": completion_response}, indent=4))
+                    if block_mode:
+                        # El bloque EOF ya marcó el final: se espera el 226 antes de cerrar
+                        reporter.response(read_response(client_socket))
+                        data_socket.close()
+                    else:
+                        # Cierra la conexión de datos
+                        transfer.end_stream(data_socket)
+                        data_socket.close()
+
+                        # Agrega verificación del mensaje 226
+                        reporter.response(read_response(client_socket))
+                else:
+                    data_socket.close()
         else:
-            print(json.dumps({"status": "500", "message": "Error al procesar la respuesta PASV"}, indent=4))
+            reporter.response(json.dumps({"status": "500", "message": "Error al procesar la respuesta PASV"}, indent=4))
     else:
-        print(json.dumps({"status": "500", "message": "Error al entrar en modo PASV"}, indent=4))
+        reporter.response(json.dumps({"status": "500", "message": "Error al entrar en modo PASV"}, indent=4))
 
-def rename_file(rnfr_response, client_socket, argument):
+# Comandos que abren una conexión de datos: van precedidos de PASV
+LISTING_COMMANDS = {"LIST", "NLST"}
+UPLOAD_COMMANDS = {"STOR", "APPE", "STOU"}
+DATA_COMMANDS = {"RETR"} | LISTING_COMMANDS | UPLOAD_COMMANDS
+
+def rename_file(rnfr_response, client_socket, argument, reporter):
     if "350" in rnfr_response:
         rnto_response = send_command(client_socket, f"RNTO {argument}\r\n")
-        print(rnto_response)
+        reporter.response(rnto_response)
+
+def command_line(name, argument=None):
+    """Línea de un comando FTP; un argumento ausente no se envía"""
+    return f"{name} {argument}\r\n" if argument is not None else f"{name}\r\n"
+
+def build_command(command, argument1, argument2):
+    """
+    Construye la línea de un comando FTP a partir de sus argumentos.
+    Devuelve None si el comando no está soportado.
+    """
+    # Diccionario de delegados para los comandos FTP
+    command_delegates = {
+        "USER": lambda: command_line("USER", argument1),
+        "PASS": lambda: command_line("PASS", argument1),
+        "ACCT": lambda: command_line("ACCT", argument1),
+        "CWD" : lambda: command_line("CWD", argument1),
+        "CDUP": lambda: command_line("CDUP"),
+        "SMNT": lambda: command_line("SMNT", argument1),
+        "REIN": lambda: command_line("REIN"),
+        "QUIT": lambda: command_line("QUIT"),
+        "PORT": lambda: command_line("PORT", argument1),
+        "PASV": lambda: command_line("PASV"),
+        "TYPE": lambda: command_line("TYPE", argument1),
+        "STRU": lambda: command_line("STRU", argument1),
+        "MODE": lambda: command_line("MODE", argument1),
+        "RETR": lambda: command_line("RETR", argument1),
+        "STOR": lambda: command_line("STOR", argument1),
+        "STOU": lambda: command_line("STOU"),
+        "APPE": lambda: command_line("APPE", argument1),
+        "ALLO": lambda: command_line("ALLO", argument1),
+        "REST": lambda: command_line("REST", argument1),
+        "RNFR": lambda: command_line("RNFR", argument1),
+        "RNTO": lambda: command_line("RNTO", argument2),
+        "ABOR": lambda: command_line("ABOR"),
+        "DELE": lambda: command_line("DELE", argument1),
+        "RMD" : lambda: command_line("RMD", argument1),
+        "MKD" : lambda: command_line("MKD", argument1),
+        "PWD" : lambda: command_line("PWD"),
+        "LIST": lambda: command_line("LIST", argument1),
+        "NLST": lambda: command_line("NLST", argument1),
+        "SITE": lambda: command_line("SITE", argument1),
+        "SYST": lambda: command_line("SYST"),
+        "STAT": lambda: command_line("STAT", argument1),
+        "HELP": lambda: command_line("HELP", argument1),
+        "NOOP": lambda: command_line("NOOP"),
+        "SIZE": lambda: command_line("SIZE", argument1),
+        "HASH": lambda: command_line("HASH", argument1),
+    }
+    delegate = command_delegates.get(command)
+    return delegate() if delegate else None
+
+def login(client_socket, username, password, reporter):
+    """
+    Se autentica con USER y PASS.
+    Devuelve True si el servidor aceptó las credenciales.
+    """
+    # Autenticación con USER y PASS, enviados juntos para ahorrar una ida y vuelta.
+    # Con ellos va TYPE I: los archivos se transfieren tal cual salvo que se pida TYPE A
+    user_reply, pass_reply, type_reply = ftp_reply.pipeline(
+        client_socket, [f"USER {username}", f"PASS {password}", "TYPE I"])
+    reporter.response(reply_json(user_reply))
+    reporter.response(reply_json(pass_reply))
+    if type_reply.code == "200":
+        _types[client_socket] = "I"
+
+    return pass_reply.code == "230"  # Código 230: Usuario autenticado
+
+def run_command(client_socket, server, command, argument1, argument2, reporter,
+                chunk_size=transfer.CHUNK_SIZE, verify_size=False):
+    """
+    Ejecuta un comando sobre una sesión ya autenticada.
+    """
+    # Si el comando abre una conexión de datos, envía PASV primero
+    if command in DATA_COMMANDS:
+        pasv_response = send_command(client_socket, "PASV\r\n")
+        reporter.response(pasv_response)
+        stor_retr_files(command, pasv_response, server, client_socket, argument1, argument2, reporter,
+                        chunk_size, verify_size)
+
+    elif command == "RNFR":
+        rnfr_response = send_command(client_socket, f"RNFR {argument1}\r\n")
+        reporter.response(rnfr_response)
+        rename_file(rnfr_response, client_socket, argument2, reporter)
+
+    else:
+        # Ejecuta otros comandos
+        line = build_command(command, argument1, argument2)
+        if line:
+            command_response = send_command(client_socket, line)
+            # Si el servidor responde en varias etapas, se espera la respuesta final
+            while json.loads(command_response)["status"].startswith("1"):
+                reporter.response(command_response)
+                command_response = read_response(client_socket)
+            if command == "TYPE" and json.loads(command_response)["status"] == "200":
+                _types[client_socket] = argument1.upper()
+            if command == "MODE" and json.loads(command_response)["status"] == "200":
+                _modes[client_socket] = argument1.upper()
+        else:
+            command_response = json.dumps({"status": "500", "message": "Comando no soportado"}, indent=4)
+
+        reporter.response(command_response)
+
+def run_batch(client_socket, server, lines, out, chunk_size=transfer.CHUNK_SIZE, verify_size=False):
+    """
+    Ejecuta una secuencia de comandos sobre la misma sesión autenticada.
+    Cada línea tiene la forma "COMANDO [argumento1 [argumento2]]"; las líneas vacías
+    y las que empiezan con # se ignoran. Por cada comando se escribe en out una línea
+    JSON con sus respuestas en cuanto termina.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        reporter = Reporter(collect=True)
+        try:
+            # Una línea mal formada (comillas sin cerrar) solo falla ese comando
+            parts = shlex.split(line)
+            command = parts[0].upper()
+            argument1 = parts[1] if len(parts) > 1 else None
+            argument2 = parts[2] if len(parts) > 2 else None
+            run_command(client_socket, server, command, argument1, argument2, reporter, chunk_size, verify_size)
+        except Exception as e:
+            reporter.response(json.dumps({"status": "500", "message": f"Error durante la ejecución: {e}"}))
+        out.write(json.dumps(reporter.result(line)) + "\n")
+        out.flush()
+
+def default_daemon_socket():
+    """Ruta del socket Unix del daemon, propia del usuario"""
+    if "FTP_CLIENT_DAEMON" in os.environ:
+        return os.environ["FTP_CLIENT_DAEMON"]
+    user = os.getuid() if hasattr(os, "getuid") else "user"
+    return os.path.join(tempfile.gettempdir(), f"ftp_client_daemon_{user}.sock")
+
+# Comandos que dejan la sesión en un estado distinto al de recién autenticada (directorio,
+# TYPE, MODE, un REST o RNFR pendiente...): tras ellos la sesión no vuelve al pool
+SESSION_STATE_COMMANDS = {"USER", "PASS", "ACCT", "CWD", "CDUP", "SMNT", "REIN", "QUIT", "PORT",
+                          "PASV", "TYPE", "STRU", "MODE", "REST", "RNFR"}
+
+class SessionPool:
+    """
+    Sesiones FTP autenticadas que el daemon mantiene abiertas entre invocaciones,
+    agrupadas por servidor, usuario y credenciales.
+    """
+    def __init__(self, max_idle=4):
+        self.max_idle = max_idle  # Sesiones libres que se guardan por clave
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, key, reporter, cafile=None):
+        """Devuelve una sesión libre para la clave o abre y autentica una nueva (None si falla el login)"""
+        with self.lock:
+            sessions = self.idle.get(key, [])
+            while sessions:
+                client_socket = sessions.pop()
+                # Una sesión libre no debe tener nada pendiente de leer, ni en el socket ni ya
+                # recibido por su lector: si lo tiene, el servidor la cerró o quedó una respuesta atrás
+                readable, _, _ = select.select([client_socket], [], [], 0)
+                if not readable and not ftp_reply.reader_for(client_socket).pending():
+                    return client_socket
+                client_socket.close()
+
+        host, port, username, password, use_tls = key
+        client_socket = connect_to_server(host, port, reporter, use_tls, cafile)
+        if login(client_socket, username, password, reporter):
+            return client_socket
+        client_socket.close()
+        return None
+
+    def release(self, key, client_socket, last_reply=None):
+        """Devuelve una sesión al pool tras ejecutar un comando. Se descarta si la última
+        respuesta fue preliminar (falta la final) o si su lector guarda datos sin entregar."""
+        preliminary = last_reply is not None and last_reply["status"].startswith("1")
+        if preliminary or ftp_reply.reader_for(client_socket).pending():
+            client_socket.close()
+            return
+        with self.lock:
+            sessions = self.idle.setdefault(key, [])
+            if len(sessions) < self.max_idle:
+                sessions.append(client_socket)
+                return
+        client_socket.close()
+
+def serve_daemon(socket_path):
+    """
+    Daemon que atiende por un socket Unix las peticiones del front-end de client.py.
+    Cada petición es una línea JSON con los argumentos de la línea de comandos y la
+    respuesta es una línea JSON con el resultado, ejecutado sobre una sesión del pool.
+    """
+    pool = SessionPool()
+
+    def handle(connection):
+        with connection, connection.makefile("rwb") as stream:
+            request = json.loads(stream.readline())
+            key = (request["host"], request["port"], request["username"],
+                   request["password"], request["use_tls"])
+            command = request["command"]
+            reporter = Reporter(collect=True)
+            client_socket = None
+            try:
+                client_socket = pool.acquire(key, reporter, request.get("cafile"))
+                if client_socket is None:
+                    reporter.response(json.dumps({"status": "530", "message": "Error de autenticación. Verifica las credenciales."}))
+                else:
+                    # Las respuestas del login solo interesan si fallan
+                    reporter.responses.clear()
+                    run_command(client_socket, request["host"], command,
+                                request["argument1"], request["argument2"], reporter,
+                                request.get("buffer_size", transfer.CHUNK_SIZE),
+                                request.get("verify_size", False))
+                    # Cada invocación espera una sesión como la de un login nuevo
+                    if command not in SESSION_STATE_COMMANDS:
+                        pool.release(key, client_socket, reporter.responses[-1] if reporter.responses else None)
+                        client_socket = None
+            except Exception as e:
+                reporter.response(json.dumps({"status": "500", "message": f"Error durante la ejecución: {e}"}))
+            finally:
+                if client_socket:
+                    client_socket.close()
+            stream.write(json.dumps(reporter.result(command)).encode() + b"\n")
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)  # Solo el usuario puede conectarse al daemon
+    try:
+        server_socket.bind(socket_path)
+    finally:
+        os.umask(old_umask)
+    server_socket.listen(16)
+    print(json.dumps({"status": "200", "message": f"Daemon escuchando en {socket_path}"}, indent=4), flush=True)
+    try:
+        while True:
+            connection, _ = server_socket.accept()
+            threading.Thread(target=handle, args=(connection,), daemon=True).start()
+    finally:
+        server_socket.close()
+        os.unlink(socket_path)
+
+def forward_to_daemon(argvs, socket_path):
+    """
+    Envía el comando al daemon si está en ejecución e imprime su resultado.
+    Devuelve False si no hay daemon, para que el comando se ejecute localmente.
+    """
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(socket_path):
+        return False
+    if argvs.command == "RETR" and argvs.argument2 == "-":
+        # Los datos binarios no viajan por el protocolo JSON del daemon
+        return False
+    daemon_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        daemon_socket.connect(socket_path)
+    except OSError:
+        daemon_socket.close()
+        return False
+
+    argument1, argument2 = argvs.argument1, argvs.argument2
+    # Las rutas locales se resuelven aquí: el daemon tiene otro directorio de trabajo
+    if argvs.command == "RETR" and argument2:
+        argument2 = os.path.abspath(argument2)
+    elif argvs.command in UPLOAD_COMMANDS and argument1:
+        argument1 = os.path.abspath(argument1)
+
+    request = {"host": argvs.host, "port": argvs.port, "username": argvs.username,
+               "password": argvs.password, "use_tls": argvs.use_tls, "command": argvs.command,
+               "argument1": argument1, "argument2": argument2,
+               "buffer_size": argvs.buffer_size, "verify_size": argvs.verify_size,
+               "cafile": argvs.cafile and os.path.abspath(argvs.cafile)}
+    with daemon_socket, daemon_socket.makefile("rwb") as stream:
+        stream.write(json.dumps(request).encode() + b"\n")
+        stream.flush()
+        result = json.loads(stream.readline())
+
+    for response in result["responses"]:
+        print(json.dumps(response, indent=4))
+    if "output" in result:
+        print(result["output"], end="")
+    return True
 
 def ftp_client(argvs):
     """
@@ -113,104 +598,71 @@ def ftp_client(argvs):
     argument1 = argvs.argument1
     argument2 = argvs.argument2
     use_tls = argvs.use_tls  # Nuevo argumento para usar o no TLS
+    # Con RETR a stdout, las respuestas van a stderr para no mezclarse con los datos
+    binary_stdout = command == "RETR" and argument2 == "-"
+    reporter = Reporter(collect=argvs.batch is not None, out=sys.stderr if binary_stdout else None)
 
-    # Diccionario de delegados para los comandos FTP
-    command_delegates = {
-        "USER": lambda: f"USER {argument1}\r\n",
-        "PASS": lambda: f"PASS {argument1}\r\n",
-        "ACCT": lambda: f"ACCT {argument1}\r\n",
-        "CWD" : lambda: f"CWD {argument1}\r\n",
-        "CDUP": lambda: f"CDUP\r\n",
-        "SMNT": lambda: f"SMNT {argument1}\r\n",
-        "REIN": lambda: f"REIN\r\n",
-        "QUIT": lambda: f"QUIT\r\n",
-        "PORT": lambda: f"PORT {argument1}\r\n",
-        "PASV": lambda: f"PASV\r\n",
-        "TYPE": lambda: f"TYPE {argument1}\r\n",
-        "STRU": lambda: f"STRU {argument1}\r\n",
-        "MODE": lambda: f"MODE {argument1}\r\n",
-        "RETR": lambda: f"RETR {argument1}\r\n",
-        "STOR": lambda: f"STOR {argument1}\r\n",
-        "STOU": lambda: f"STOU\r\n",
-        "APPE": lambda: f"APPE {argument1}\r\n",
-        "ALLO": lambda: f"ALLO {argument1}\r\n",
-        "REST": lambda: f"REST {argument1}\r\n",
-        "RNFR": lambda: f"RNFR {argument1}\r\n",
-        "RNTO": lambda: f"RNTO {argument2}\r\n",
-        "ABOR": lambda: f"ABOR\r\n",
-        "DELE": lambda: f"DELE {argument1}\r\n",
-        "RMD" : lambda: f"RMD {argument1}\r\n",
-        "MKD" : lambda: f"MKD {argument1}\r\n",
-        "PWD" : lambda: f"PWD\r\n",
-        "LIST": lambda: f"LIST {argument1}\r\n",
-        "NLST": lambda: f"NLST {argument1}\r\n",
-        "SITE": lambda: f"SITE {argument1}\r\n",
-        "SYST": lambda: f"SYST\r\n",
-        "STAT": lambda: f"STAT {argument1}\r\n",
-        "HELP": lambda: f"HELP {argument1}\r\n",
-        "NOOP": lambda: f"NOOP\r\n",
-    }
-
+    client_socket = None
     try:
         # Conecta al servidor
-        client_socket = connect_to_server(server, port, use_tls)
-
-        # Recibe el mensaje de bienvenida del servidor
-        welcome_message = client_socket.recv(1024).decode().strip()
-        welcome_status = welcome_message.split(" ")[0]
-        print(json.dumps({"status": welcome_status, "message": welcome_message}, indent=4))
-
-        # Autenticación con USER y PASS
-        user_response = send_command(client_socket, f"USER {username}\r\n")
-        print(user_response)
-
-        pass_response = send_command(client_socket, f"PASS {password}\r\n")
-        print(pass_response)
+        client_socket = connect_to_server(server, port, reporter, use_tls, argvs.cafile)
 
         # Verifica si la autenticación fue exitosa
-        if "230" in pass_response:  # Código 230: Usuario autenticado
-            # Si el comando es RETR, envía PASV primero
-            if command == "RETR" or command == "STOR":
-                pasv_response = send_command(client_socket, "PASV\r\n")
-                print(pasv_response)
-                stor_retr_files(command, pasv_response, server, client_socket, argument1, argument2);
-                
-            elif command == "RNFR":
-                rnfr_response = send_command(client_socket, f"RNFR {argument1}\r\n")
-                print(rnfr_response)
-                rename_file(rnfr_response, client_socket, argument2)
-                
-            else:
-                # Ejecuta otros comandos
-                if command in command_delegates:
-                    command_response = send_command(client_socket, command_delegates[command]())
-                else:
-                    command_response = json.dumps({"status": "500", "message": "Comando no soportado"}, indent=4)
+        authenticated = login(client_socket, username, password, reporter)
+        if not authenticated:
+            reporter.response(json.dumps({"status": "530", "message": "Error de autenticación. Verifica las credenciales."}, indent=4))
 
-                print(command_response)
-        else:
-            print(json.dumps({"status": "530", "message": "Error de autenticación. Verifica las credenciales."}, indent=4))
+        if argvs.batch is not None:
+            # Modo por lotes: la conexión y el login se informan como un primer resultado
+            print(json.dumps(reporter.result("LOGIN")), flush=True)
+            if authenticated:
+                # Todos los comandos se ejecutan sobre esta misma sesión
+                if argvs.batch == "-":
+                    run_batch(client_socket, server, sys.stdin, sys.stdout, argvs.buffer_size, argvs.verify_size)
+                else:
+                    with open(argvs.batch) as batch_file:
+                        run_batch(client_socket, server, batch_file, sys.stdout, argvs.buffer_size, argvs.verify_size)
+        elif authenticated:
+            run_command(client_socket, server, command, argument1, argument2, reporter,
+                        argvs.buffer_size, argvs.verify_size)
 
     except Exception as e:
-        print(json.dumps({"status": "500", "message": f"Error durante la ejecución: {e}"}, indent=4))
+        error = {"status": "500", "message": f"Error durante la ejecución: {e}"}
+        if argvs.batch is not None:
+            print(json.dumps({"command": "ERROR", "responses": [error]}))
+        else:
+            print(json.dumps(error, indent=4), file=reporter.out)
     finally:
         # Cierra la conexión
-        client_socket.close()
+        if client_socket:
+            client_socket.close()
 
 if __name__ == "__main__":
     # Configura el parser de argumentos
     parser = argparse.ArgumentParser(description="Cliente FTP en Python", add_help=False)
-    parser.add_argument("-h", "--host", required=True, help="Dirección del servidor FTP")
+    # El daemon recibe el servidor y las credenciales en cada petición
+    session_required = "--daemon" not in sys.argv
+    parser.add_argument("-h", "--host", required=session_required, help="Dirección del servidor FTP")
     parser.add_argument("-p", "--port", type=int, default=21, help="Puerto del servidor FTP")
-    parser.add_argument("-u", "--username", required=True, help="Nombre de usuario")
-    parser.add_argument("-w", "--password", required=True, help="Contraseña")
+    parser.add_argument("-u", "--username", required=session_required, help="Nombre de usuario")
+    parser.add_argument("-w", "--password", required=session_required, help="Contraseña")
     parser.add_argument("-c", "--command", required=False, help="Comando a ejecutar")
     parser.add_argument("-a", "--argument1", required=False, help="Primer argumento del comando")
     parser.add_argument("-b", "--argument2", required=False, help="Segundo argumento del comando")
-    parser.add_argument("--use_tls", action="store_true", help="Usar TLS/SSL para la conexión")
+    parser.add_argument("--use_tls", action="store_true", help="Proteger la sesión con TLS explícito (AUTH TLS y PROT P)")
+    parser.add_argument("--cafile", help="Certificado de CA en PEM para verificar el del servidor")
+    parser.add_argument("--buffer-size", type=int, default=transfer.CHUNK_SIZE, help="Tamaño del buffer de las transferencias")
+    parser.add_argument("--verify-size", action="store_true", help="Comprobar con SIZE que RETR recibió el archivo completo")
+    parser.add_argument("--batch", required=False, help="Archivo con un comando por línea ('-' para stdin), ejecutados en una sola sesión")
+    parser.add_argument("--daemon", action="store_true", help="Iniciar el daemon que mantiene las sesiones abiertas entre invocaciones")
+    parser.add_argument("--daemon-socket", default=default_daemon_socket(), help="Socket Unix del daemon")
+    parser.add_argument("--no-daemon", action="store_true", help="Ejecutar localmente aunque haya un daemon en ejecución")
 
     # Parsea los argumentos
     argvs = parser.parse_args()
 
-    # Llama a la función principal del cliente FTP
-    ftp_client(argvs)
+    if argvs.daemon:
+        serve_daemon(argvs.daemon_socket)
+    elif argvs.batch is not None or argvs.no_daemon or not forward_to_daemon(argvs, argvs.daemon_socket):
+        # Llama a la función principal del cliente FTP
+        ftp_client(argvs)
@@ -0,0 +1,146 @@
+import os
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("ftp.digest")
+
+# Tamaño de las lecturas al calcular un resumen
+CHUNK_SIZE = 1024 * 1024
+
+class CRC32:
+    """Adaptador de zlib.crc32 con la interfaz de hashlib"""
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def hexdigest(self):
+        return f"{self.value:08x}"
+
+# Nombres de los algoritmos como en HASH (draft-bryan-ftpext-hash)
+ALGORITHMS = {
+    "SHA-256": hashlib.sha256,
+    "MD5": hashlib.md5,
+    "CRC32": CRC32,
+}
+
+def file_digest(path, algorithm, chunk_size=CHUNK_SIZE):
+    """Calcula el resumen de un archivo leyéndolo por bloques sobre un único buffer"""
+    h = ALGORITHMS[algorithm]()
+    buffer = memoryview(bytearray(chunk_size))
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            h.update(buffer[:n])
+    return h.hexdigest()
+
+class DigestIndex:
+    """
+    Índice persistente (sqlite3) de resúmenes ya calculados. Un resumen vale mientras
+    el archivo conserve dispositivo, inodo, tamaño y fecha de modificación; si cambia
+    cualquiera de ellos la entrada deja de coincidir y se recalcula.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.connection = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        # La base se abre la primera vez que se usa, no al crear el servidor
+        if self.connection is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS digests (
+                dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER,
+                algorithm TEXT, digest TEXT,
+                PRIMARY KEY (dev, ino, algorithm))""")
+        return self.connection
+
+    def get(self, key, algorithm):
+        dev, ino, size, mtime_ns = key
+        with self.lock:
+            row = self.connect().execute(
+                "SELECT digest FROM digests WHERE dev=? AND ino=? AND algorithm=? AND size=? AND mtime_ns=?",
+                (dev, ino, algorithm, size, mtime_ns)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, algorithm, digest):
+        with self.lock:
+            connection = self.connect()
+            connection.execute("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?, ?)",
+                               (*key, algorithm, digest))
+            connection.commit()
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+class Hasher:
+    """
+    Calcula resúmenes en un pool acotado de hilos y los guarda en el índice. El pool
+    limita cuántos archivos se leen a la vez; el hilo de la sesión que pide un resumen
+    espera el resultado (en el bucle de eventos ocupa un hilo de trabajo, no el bucle).
+    Varias peticiones del mismo archivo sin cambios comparten un único cálculo. Si el índice falla (base bloqueada o dañada),
+    el resumen se calcula igualmente sin guardarlo.
+    """
+    def __init__(self, index, max_workers=4, chunk_size=CHUNK_SIZE):
+        self.index = index
+        self.chunk_size = chunk_size
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hash")
+        self.pending = {}  # (clave, algoritmo) -> Future del cálculo en curso
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.hashed_bytes = 0
+
+    def digest(self, path, algorithm):
+        """Devuelve el resumen hexadecimal del archivo; bloquea el hilo que llama hasta tenerlo"""
+        st = os.stat(path)
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        try:
+            cached = self.index.get(key, algorithm)
+        except (sqlite3.Error, OSError) as e:
+            logger.error("No se pudo consultar el índice de resúmenes: %s", e)
+            cached = None
+        with self.lock:
+            if cached is not None:
+                self.hits += 1
+                return cached
+            future = self.pending.get((key, algorithm))
+            if future is None:
+                self.misses += 1
+                future = self.executor.submit(self.compute, path, key, algorithm)
+                self.pending[(key, algorithm)] = future
+        return future.result()
+
+    def compute(self, path, key, algorithm):
+        try:
+            digest = file_digest(path, algorithm, self.chunk_size)
+            # Si el archivo cambió mientras se leía, el resumen no se guarda
+            st = os.stat(path)
+            if (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns) == key:
+                try:
+                    self.index.put(key, algorithm, digest)
+                except (sqlite3.Error, OSError) as e:
+                    logger.error("No se pudo guardar el resumen en el índice: %s", e)
+            with self.lock:
+                self.hashed_bytes += key[2]
+            return digest
+        finally:
+            with self.lock:
+                self.pending.pop((key, algorithm), None)
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "hashed_bytes": self.hashed_bytes,
+                    "pending": len(self.pending)}
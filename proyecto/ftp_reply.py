@@ -0,0 +1,107 @@
+import weakref
+from collections import deque
+
+class Reply:
+    """Respuesta completa del servidor: código de 3 dígitos y sus líneas de texto."""
+    def __init__(self, code, lines):
+        self.code = code
+        self.lines = lines
+
+    @property
+    def text(self):
+        """Texto de la respuesta tal como llegó, sin el último fin de línea"""
+        return "\r\n".join(self.lines)
+
+    def is_preliminary(self):
+        """Respuestas 1xx: habrá otra respuesta para el mismo comando"""
+        return self.code.startswith("1")
+
+    def __repr__(self):
+        return f"Reply({self.code!r}, {self.lines!r})"
+
+class ReplyReader:
+    """
+    Separa las respuestas del servidor a medida que llegan los datos (RFC 959 sección 4.2).
+    Una respuesta de varias líneas empieza con "ddd-" y termina con la línea "ddd "
+    del mismo código. Lo que sobra tras una respuesta queda en el buffer para la
+    siguiente, de modo que se pueden enviar varios comandos seguidos y leer sus
+    respuestas después.
+    """
+    def __init__(self, sock=None, bufsize=8192):
+        self.sock = sock
+        self.bufsize = bufsize
+        self.buffer = bytearray()
+        self.scanned = 0     # Bytes del buffer ya revisados sin encontrar fin de línea
+        self.code = None     # Código de la respuesta de varias líneas en curso
+        self.lines = []      # Líneas de la respuesta en curso
+        self.replies = deque()
+
+    def feed(self, data):
+        """Añade datos recibidos y devuelve la cantidad de respuestas completas pendientes"""
+        self.buffer += data
+        start = 0
+        while True:
+            end = self.buffer.find(b"\n", max(start, self.scanned))
+            if end < 0:
+                break
+            line = self.buffer[start:end].rstrip(b"\r").decode(errors="replace")
+            start = end + 1
+            self.add_line(line)
+        # Solo se conserva la línea incompleta, que ya no hay que volver a revisar
+        del self.buffer[:start]
+        self.scanned = len(self.buffer)
+        return len(self.replies)
+
+    def add_line(self, line):
+        self.lines.append(line)
+        if self.code is None:
+            code = line[:3]
+            if len(line) >= 4 and line[3] == "-" and code.isdigit():
+                self.code = code
+                return
+            self.finish(code)
+        elif line[:3] == self.code and line[3:4] in (" ", ""):
+            self.finish(self.code)
+
+    def finish(self, code):
+        self.replies.append(Reply(code, self.lines))
+        self.code = None
+        self.lines = []
+
+    def pending(self):
+        """Indica si quedan respuestas o bytes recibidos sin entregar"""
+        return bool(self.replies or self.lines or self.buffer)
+
+    def read_reply(self):
+        """Devuelve la siguiente respuesta completa, recibiendo del socket lo que haga falta"""
+        while not self.replies:
+            data = self.sock.recv(self.bufsize)
+            if not data:
+                raise ConnectionError("El servidor cerró la conexión de control")
+            self.feed(data)
+        return self.replies.popleft()
+
+    def read_final_reply(self):
+        """Salta las respuestas preliminares (1xx) y devuelve la respuesta final"""
+        reply = self.read_reply()
+        while reply.is_preliminary():
+            reply = self.read_reply()
+        return reply
+
+_readers = weakref.WeakKeyDictionary()
+
+def reader_for(sock):
+    """Lector asociado a un socket de control, para no perder bytes entre llamadas"""
+    reader = _readers.get(sock)
+    if reader is None:
+        reader = _readers[sock] = ReplyReader(sock)
+    return reader
+
+def pipeline(sock, commands):
+    """
+    Envía varios comandos de una sola vez y devuelve la primera respuesta de cada uno,
+    en orden. Los comandos no deben abrir transferencias.
+    """
+    sock.sendall("".join(f"{command}\r\n" for command in commands).encode())
+    reader = reader_for(sock)
+    return [reader.read_reply() for _ in commands]
@@ -1,14 +1,38 @@
 import socket
+import ssl
 import os
 import re
+import io
+import glob
+import time
+import queue
+import threading
+from fnmatch import fnmatch
 from pathlib import Path
+import transfer
+import ftp_reply
+import tls
+import digest
 
 class FTPClient:
-    def __init__(self, host='127.0.0.1', port=21):
+    def __init__(self, host='127.0.0.1', port=21, downloads_folder=None):
         self.host = host
         self.port = port
         self.sock = None  # Inicializar el socket como None
-        self.downloads_folder = str(Path.cwd() / "Downloads")  # Carpeta local Downloads
+        self.reader = None  # Separa las respuestas que llegan por la conexión de control
+        self.mode = 'S'  # Modo de transferencia acordado con el servidor (MODE)
+        self.transfer_type = 'A'  # Tipo de representación (TYPE); tras el login se pide I
+        self.data_sock = None  # Conexión de datos que se mantiene abierta en modo bloque
+        self.restart_marker = None  # Último marcador de reinicio recibido en modo bloque
+        self.username = None  # Último usuario enviado con USER
+        self.credentials = None  # (usuario, contraseña) aceptados, para abrir sesiones paralelas
+        self.chunk_size = transfer.CHUNK_SIZE  # Buffer de las transferencias que no usan copia cero
+        self.show_progress = True  # Mostrar el avance de las subidas
+        self.tls = False  # Sesión protegida con AUTH TLS y PROT P
+        self.cafile = None  # CA con la que se verificó el certificado del servidor
+        self.verify = None  # Algoritmo (p. ej. "SHA-256") para comprobar cada transferencia con HASH
+        self.hash_algorithm = None  # Algoritmo de HASH elegido en el servidor con OPTS
+        self.downloads_folder = downloads_folder or str(Path.cwd() / "Downloads")  # Carpeta local Downloads
         # Crear la carpeta si no existe
         os.makedirs(self.downloads_folder, exist_ok=True)
         print(f"Carpeta de descargas: {self.downloads_folder}")
@@ -20,19 +44,91 @@ class FTPClient:
         
         full_command = f"{command} {' '.join(args)}".strip()
         self.sock.send(f"{full_command}\r\n".encode())
+        response = self.read_reply()
+
+        if command.upper() == "MODE" and args and response.startswith("200"):
+            self.set_mode(args[0].upper())
+        elif command.upper() == "TYPE" and args and response.startswith("200"):
+            self.transfer_type = args[0].upper()
+        elif command.upper() == "USER" and args:
+            self.username = args[0]
+        elif command.upper() == "PASS" and args and response.startswith("230"):
+            self.credentials = (self.username, args[0])
+            # Los archivos se transfieren tal cual salvo que se pida TYPE A
+            self.send_command("TYPE", "I")
         
-        response = ""
-        while True:
-            data = self.sock.recv(8192).decode()
-            if not data:  # Si no hay más datos, salir del bucle
-                break
-            response += data
-            # Verificar si la respuesta termina con un código de estado (por ejemplo, "226")
-            if re.search(r"\d{3} .*\r\n", response):
-                break
-        
         return response
 
+    def auth_tls(self, cafile=None):
+        """
+        Protege la conexión de control con TLS explícito (AUTH TLS) y pide conexiones
+        de datos protegidas (PBSZ 0, PROT P). Devuelve las respuestas del servidor.
+        """
+        response = self.send_command("AUTH", "TLS")
+        if not response.startswith("234"):
+            return response
+        context = tls.client_context(cafile)
+        self.sock = context.wrap_socket(self.sock, server_hostname=self.host)
+        self.reader = ftp_reply.ReplyReader(self.sock)
+        self.tls = True
+        self.cafile = cafile
+        response += self.send_command("PBSZ", "0")
+        response += self.send_command("PROT", "P")
+        return response
+
+    def protect_data_socket(self, data_sock):
+        """Con TLS activo, protege la conexión de datos reanudando la sesión de la de control."""
+        if self.tls and isinstance(self.sock, ssl.SSLSocket):
+            return tls.wrap_data_socket(self.sock, data_sock, self.host)
+        return data_sock
+
+    def login(self, username, password):
+        """Se autentica con USER y PASS. Devuelve True si el servidor aceptó las credenciales."""
+        self.send_command("USER", username)
+        return self.send_command("PASS", password).startswith("230")
+
+    def read_reply(self):
+        """Lee la siguiente respuesta completa (de una o varias líneas) de la conexión de control."""
+        return self.reader.read_reply().text + "\r\n"
+
+    def wait_transfer(self, response):
+        """Tras la respuesta 150 de una transferencia, lee hasta la respuesta final (226 o error)."""
+        while response.startswith("1"):
+            response = self.read_reply()
+        return response
+
+    def set_mode(self, mode):
+        """Registra el modo de transferencia aceptado por el servidor."""
+        if mode != self.mode:
+            self.close_data_connection()
+        self.mode = mode
+
+    def data_connection(self):
+        """
+        Devuelve la conexión de datos para la próxima transferencia. En modo bloque se
+        reutiliza la conexión abierta y se evita un nuevo PASV; si no, se abre con PASV.
+        """
+        if self.mode == 'B' and self.data_sock:
+            return self.data_sock
+        data_sock = self.enter_passive_mode()
+        if self.mode == 'B':
+            self.data_sock = data_sock
+        return data_sock
+
+    def release_data_connection(self, sock, failed=False):
+        """Cierra la conexión de datos al terminar, salvo la persistente del modo bloque."""
+        if sock is self.data_sock and not failed:
+            return
+        if sock is self.data_sock:
+            self.data_sock = None
+        sock.close()
+
+    def close_data_connection(self):
+        """Cierra la conexión de datos persistente del modo bloque si existe."""
+        if self.data_sock:
+            self.data_sock.close()
+            self.data_sock = None
+
     def send_command_and_file(self, data_sock, command, *args):
         """Envía un comando STOR al servidor FTP."""
         if not self.sock:
@@ -41,21 +137,14 @@ class FTPClient:
         full_command = f"{command} {' '.join(args)}".strip()
         self.sock.send(f"{full_command}\r\n".encode())
         
-        response = ""
-        while True:
-            data = self.sock.recv(8192).decode()
-            if not data:  # Si no hay más datos, salir del bucle
-                break
-            if "150" in data:
-                if self.send_file(data_sock, args[0]):
-                    print("Archivo enviado exitosamente")
-                else:
-                    print("Error al enviar archivo")
-            response += data
-            
-            # Verificar si la respuesta termina con un código de estado (por ejemplo, "226")
-            if re.search(r"226 .*\r\n", response) or data.startswith("5"):
-                break
+        response = self.read_reply()
+        if response.startswith("150"):
+            if self.send_file(data_sock, args[0]):
+                print("Archivo enviado exitosamente")
+            else:
+                print("Error al enviar archivo")
+            # Respuesta final de la transferencia (226 o error)
+            response += self.wait_transfer(response)
         
         return response
 
@@ -67,52 +156,408 @@ class FTPClient:
         full_command = f"{command} {' '.join(args)}".strip()
         self.sock.send(f"{full_command}\r\n".encode())
         
-        response = ""
-        while True:
-            data = self.sock.recv(8192).decode()
-            if not data:  # Si no hay más datos, salir del bucle
-                break
-            response += data
-            # Verificar si la respuesta termina con un código de estado (por ejemplo, "226")
-            if re.search(r"226 .*\r\n", response) or data.startswith("5"):
-                break
+        response = self.read_reply()
+        if response.startswith("1"):
+            response += self.wait_transfer(response)
         
         return response
 
-    def send_file(self, sock, filename):
-        """Envía un archivo al servidor."""
+    def send_file(self, sock, filename, progress=None):
+        """Envía un archivo al servidor. progress recibe el avance en lugar de la terminal."""
         try:
-            print(filename)
             with open(filename, 'rb') as f:
-                while True:
-                    data = f.read()
-                    print(data)
-                    if not data:
-                        break
-                    sock.send(data)
-            sock.send(b'EOF')
+                if progress is None and self.show_progress:
+                    progress = transfer.Progress(os.fstat(f.fileno()).st_size)
+                # En TYPE A las líneas viajan con CRLF
+                source = transfer.AsciiReader(f) if self.transfer_type == 'A' else f
+                if self.mode == 'B':
+                    # El bloque EOF marca el final y la conexión queda abierta
+                    transfer.send_file_blocks(sock, source, progress=progress)
+                else:
+                    # Memoria constante y copia cero del kernel cuando se puede
+                    transfer.send_file(sock, source, chunk_size=self.chunk_size, progress=progress,
+                                       zero_copy=self.transfer_type != 'A')
+                    # El fin de la transferencia se indica cerrando la conexión de datos
+                    transfer.end_stream(sock)
+            if progress:
+                progress.finish()
             return True
+        except transfer.Cancelled:
+            # Una cancelación no es un error de envío: la maneja quien pidió la transferencia
+            if sock is self.data_sock:
+                self.data_sock = None
+            raise
         except Exception as e:
             print(f"Error al enviar archivo: {e}")
+            # Tras un error la conexión persistente del modo bloque queda inservible
+            if sock is self.data_sock:
+                self.data_sock = None
             return False
 
-    def receive_file(self, sock, filename):
-        """Recibe un archivo del servidor en la carpeta Downloads local."""
+    def remote_size(self, filename):
+        """Devuelve el tamaño de un archivo remoto (SIZE) o None si no se puede obtener."""
+        response = self.send_command("SIZE", filename)
+        match = re.match(r"213 (\d+)", response)
+        return int(match.group(1)) if match else None
+
+    def working_directory(self):
+        """Directorio actual de la sesión (PWD), relativo a la raíz del usuario; None si no se puede obtener."""
+        match = re.match(r'257 "(.*)"', self.send_command("PWD"))
+        return match.group(1) if match else None
+
+    def restart_download(self, filename):
+        """
+        Si hay una descarga parcial del archivo en la carpeta Downloads, pide al servidor
+        reanudarla (REST) y devuelve el desplazamiento. Devuelve 0 si hay que empezar de cero.
+        """
+        download_path = os.path.join(self.downloads_folder, filename)
+        # En TYPE A el tamaño local no corresponde con el remoto
+        if self.transfer_type == 'A' or not os.path.isfile(download_path):
+            return 0
+        offset = os.path.getsize(download_path)
+        size = self.remote_size(filename)
+        if not offset or size is None or offset > size:
+            return 0
+        response = self.send_command("REST", str(offset))
+        return offset if response.startswith("350") else 0
+
+    def receive_file(self, sock, filename, offset=0, progress=None):
+        """Recibe un archivo del servidor en la carpeta Downloads local.
+        Si offset no es cero, los datos se añaden a la descarga parcial existente."""
         try:
             # Construir la ruta completa en la carpeta Downloads local
             download_path = os.path.join(self.downloads_folder, filename)
-            with open(download_path, 'wb') as f:
-                while True:
-                    data = sock.recv(8192)
-                    if not data:  # Detectar fin de transferencia
-                        break
-                    f.write(data)
+            with open(download_path, 'ab' if offset else 'wb') as f:
+                # En TYPE A se pasa de CRLF a los finales de línea locales
+                if self.transfer_type == 'A':
+                    f = transfer.AsciiWriter(f)
+                if self.mode == 'B':
+                    buffer = memoryview(bytearray(transfer.MAX_BLOCK))
+                    transfer.receive_file_blocks(sock, f, buffer, self.record_marker, progress)
+                else:
+                    while True:
+                        data = sock.recv(8192)
+                        if not data:  # Detectar fin de transferencia
+                            break
+                        f.write(data)
+                        if progress:
+                            progress.update(len(data))
+                if self.transfer_type == 'A':
+                    f.finish()
             print(f"Archivo guardado en: {download_path}")
             return True
+        except transfer.Cancelled:
+            # Una cancelación no es un error de recepción: la maneja quien pidió la transferencia
+            if sock is self.data_sock:
+                self.data_sock = None
+            raise
         except Exception as e:
             print(f"Error al recibir archivo: {e}")
+            if sock is self.data_sock:
+                self.data_sock = None
             return False
 
+    def record_marker(self, marker):
+        """Guarda el último marcador de reinicio; sirve como argumento de REST."""
+        self.restart_marker = marker
+
+    def receive_listing(self, sock):
+        """Recibe el resultado de LIST o NLST por la conexión de datos."""
+        listing = io.BytesIO()
+        if self.mode == 'B':
+            buffer = memoryview(bytearray(transfer.MAX_BLOCK))
+            transfer.receive_file_blocks(sock, listing, buffer)
+        else:
+            while True:
+                data = sock.recv(8192)
+                if not data:
+                    break
+                listing.write(data)
+        return listing.getvalue().decode()
+
+    def remote_files(self, patterns):
+        """Archivos del directorio remoto actual (NLST) que coinciden con algún patrón glob."""
+        data_sock = self.data_connection()
+        failed = True
+        try:
+            response = self.send_command("NLST")
+            if not response.startswith("150"):
+                raise Exception(response.strip())
+            names = self.receive_listing(data_sock).split("\r\n")
+            failed = False
+        finally:
+            self.release_data_connection(data_sock, failed)
+        response = self.wait_transfer(response)
+        if not re.search(r"^226 ", response, re.M):
+            raise Exception(response.strip())
+        return [name for name in names if name and any(fnmatch(name, p) for p in patterns)]
+
+    def download(self, filename, progress=None, resume=False):
+        """Descarga un archivo por su propia conexión PASV y devuelve los bytes recibidos.
+        Con resume se continúa la descarga parcial que haya en Downloads."""
+        offset = self.restart_download(filename) if resume else 0
+        data_sock = self.enter_passive_mode()
+        if data_sock is None:
+            raise ConnectionError("No se pudo entrar en modo pasivo")
+        try:
+            response = self.send_command("RETR", filename)
+            if not response.startswith("150"):
+                raise Exception(response.strip())
+            received = self.receive_file(data_sock, filename, offset, progress)
+        finally:
+            data_sock.close()
+        response = self.wait_transfer(response)
+        if not received or not re.search(r"^226 ", response, re.M):
+            raise Exception(response.strip())
+        path = os.path.join(self.downloads_folder, filename)
+        if self.verify and self.transfer_type != 'A':
+            self.verify_file(filename, path)
+        return os.path.getsize(path)
+
+    def upload(self, path, progress=None, command="STOR"):
+        """Sube un archivo local con su nombre base por su propia conexión PASV y devuelve los bytes enviados.
+        command puede ser APPE para añadirlo al final del archivo remoto."""
+        data_sock = self.enter_passive_mode()
+        if data_sock is None:
+            raise ConnectionError("No se pudo entrar en modo pasivo")
+        try:
+            response = self.send_command(command, os.path.basename(path))
+            if not response.startswith("150"):
+                raise Exception(response.strip())
+            sent = self.send_file(data_sock, path, progress)
+        finally:
+            data_sock.close()
+        response = self.wait_transfer(response)
+        if not sent or not re.search(r"^226 ", response, re.M):
+            raise Exception(response.strip())
+        if self.verify and command == "STOR" and self.transfer_type != 'A':
+            self.verify_file(os.path.basename(path), path)
+        return os.path.getsize(path)
+
+    def download_range(self, filename, path, start, end, size=None, progress=None):
+        """
+        Descarga los bytes start..end (inclusive) de un archivo remoto con RANG y los
+        escribe en su posición dentro del archivo local ya reservado. Con size, comprueba
+        antes en esta misma sesión que el archivo remoto tiene el tamaño esperado.
+        progress, si se indica, recibe los bytes a medida que llegan.
+        Devuelve los bytes recibidos.
+        """
+        # Los rangos son posiciones en bytes: en TYPE A el servidor convertiría los finales
+        # de línea y los segmentos no caerían en su sitio
+        if self.transfer_type != 'I' and not self.send_command("TYPE", "I").startswith("200"):
+            raise Exception("El servidor no aceptó TYPE I para descargar por rangos")
+        if size is not None and self.remote_size(filename) != size:
+            raise Exception(f"{filename} no tiene en esta sesión el tamaño esperado ({size} bytes)")
+        response = self.send_command("RANG", str(start), str(end))
+        if not response.startswith("350"):
+            raise Exception(response.strip())
+        data_sock = self.enter_passive_mode()
+        if data_sock is None:
+            raise ConnectionError("No se pudo entrar en modo pasivo")
+        expected = end - start + 1
+        received = 0
+        try:
+            response = self.send_command("RETR", filename)
+            if not response.startswith("150"):
+                raise Exception(response.strip())
+            buffer = memoryview(bytearray(transfer.CHUNK_SIZE))
+            with open(path, 'r+b') as f:
+                f.seek(start)
+                while received < expected:
+                    n = data_sock.recv_into(buffer[:min(len(buffer), expected - received)])
+                    if not n:
+                        break
+                    f.write(buffer[:n])
+                    received += n
+                    if progress:
+                        progress.update(n)
+        finally:
+            data_sock.close()
+        response = self.wait_transfer(response)
+        if received != expected or not re.search(r"^226 ", response, re.M):
+            raise Exception(f"Rango {start}-{end} incompleto: {received} de {expected} bytes. {response.strip()}")
+        return received
+
+    def download_segmented(self, filename, segments=4, progress=None):
+        """
+        Descarga un archivo dividido en rangos de bytes que se piden en paralelo, cada uno
+        por su propia sesión y conexión PASV, sobre un archivo local reservado de antemano.
+        La copia es siempre binaria (TYPE I), aunque esta sesión esté en TYPE A.
+        progress recibe los bytes de todos los segmentos, desde varios hilos.
+        Devuelve el resumen (bytes, segundos, throughput) y lanza una excepción si el
+        archivo final no queda completo.
+        """
+        size = self.remote_size(filename)
+        if size is None:
+            raise Exception(f"No se pudo obtener el tamaño de {filename}")
+        path = os.path.join(self.downloads_folder, filename)
+        with open(path, 'wb') as f:
+            if size and hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(f.fileno(), 0, size)
+            else:
+                f.truncate(size)
+
+        segments = max(1, min(segments, size))
+        step = -(-size // segments) if size else 0
+        ranges = [(start, min(start + step, size) - 1) for start in range(0, size, step or 1)]
+        errors = []
+        directory = self.working_directory()
+
+        def worker(start, end):
+            try:
+                session = self.open_session(directory)
+            except Exception as e:
+                errors.append(str(e))
+                return
+            try:
+                session.download_range(filename, path, start, end, size, progress)
+            except Exception as e:
+                errors.append(str(e))
+            finally:
+                session.close()
+
+        begin = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=r) for r in ranges]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - begin
+
+        if errors:
+            raise Exception("; ".join(errors))
+        if os.path.getsize(path) != size:
+            raise Exception(f"Tamaño final {os.path.getsize(path)} distinto del remoto {size}")
+        if self.verify:
+            self.verify_file(filename, path)
+        return {"file": filename, "bytes": size, "segments": len(ranges), "seconds": elapsed,
+                "throughput": size / elapsed if elapsed > 0 else 0.0}
+
+    def remote_digest(self, filename, algorithm="SHA-256"):
+        """Resumen de un archivo remoto calculado por el servidor (HASH); None si no lo soporta."""
+        if algorithm != self.hash_algorithm:
+            if not self.send_command("OPTS", "HASH", algorithm).startswith("200"):
+                return None
+            self.hash_algorithm = algorithm
+        match = re.match(r"213 \S+ \S+ ([0-9a-fA-F]+)", self.send_command("HASH", filename))
+        return match.group(1).lower() if match else None
+
+    def verify_file(self, filename, path, algorithm=None):
+        """
+        Compara el resumen de una copia local con el del archivo remoto y lo devuelve.
+        Lanza una excepción si no coinciden o si el servidor no puede calcularlo.
+        """
+        algorithm = algorithm or self.verify or "SHA-256"
+        remote = self.remote_digest(filename, algorithm)
+        if remote is None:
+            raise Exception(f"El servidor no pudo calcular {algorithm} de {filename}")
+        local = digest.file_digest(path, algorithm)
+        if local != remote:
+            raise Exception(f"{algorithm} de {filename} no coincide: local {local}, remoto {remote}")
+        return local
+
+    def open_session(self, directory=None):
+        """
+        Abre otra sesión autenticada con el mismo servidor y credenciales, situada en
+        directory o, si no se indica, en el directorio actual de esta sesión. Los hilos
+        que abren sesiones en paralelo deben pasar directory: la conexión de control de
+        esta sesión no admite comandos desde varios hilos a la vez.
+        """
+        if not self.credentials:
+            raise Exception("Inicie sesión (USER y PASS) antes de transferir en paralelo.")
+        if directory is None:
+            directory = self.working_directory()
+        session = FTPClient(self.host, self.port, self.downloads_folder)
+        session.chunk_size = self.chunk_size
+        session.verify = self.verify
+        # Varias sesiones en paralelo no pueden compartir la línea de avance
+        session.show_progress = False
+        session.start()
+        if self.tls:
+            session.auth_tls(self.cafile)
+        if not session.login(*self.credentials):
+            session.close()
+            raise Exception("El servidor rechazó las credenciales en una sesión paralela.")
+        if self.transfer_type != session.transfer_type:
+            session.send_command("TYPE", self.transfer_type)
+        if directory not in (None, "."):
+            # Una sesión nueva empieza en la raíz, desde la que PWD expresa las rutas
+            response = session.send_command("CWD", directory)
+            if not response.startswith("250"):
+                session.close()
+                raise Exception(f"No se pudo entrar en {directory} en una sesión paralela: {response.strip()}")
+        return session
+
+    def mget(self, patterns, workers=4):
+        """Descarga en paralelo los archivos remotos que coinciden con los patrones."""
+        return self.transfer_parallel("download", self.remote_files(patterns), workers)
+
+    def mput(self, patterns, workers=4):
+        """Sube en paralelo los archivos locales que coinciden con los patrones."""
+        return self.transfer_parallel("upload", self.local_files(patterns), workers)
+
+    def local_files(self, patterns):
+        """Archivos locales que coinciden con algún patrón glob."""
+        return sorted({path for pattern in patterns for path in glob.glob(pattern) if os.path.isfile(path)})
+
+    def transfer_parallel(self, operation, names, workers):
+        """
+        Reparte las transferencias entre un pool de sesiones paralelas, cada una con su
+        conexión de control y sus conexiones PASV. Devuelve el resultado de cada archivo
+        (nombre, bytes, segundos, error) y el resumen agregado.
+        """
+        pending = queue.SimpleQueue()
+        for name in names:
+            pending.put(name)
+        results = []
+        lock = threading.Lock()
+        directory = self.working_directory()
+
+        def worker():
+            try:
+                session = self.open_session(directory)
+            except Exception as e:
+                # Sin sesión propia, el hilo no toma archivos y los demás se los reparten
+                with lock:
+                    results.append({"file": None, "bytes": 0, "seconds": 0.0, "error": str(e)})
+                return
+            try:
+                while True:
+                    try:
+                        name = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    start = time.perf_counter()
+                    result = {"file": name, "bytes": 0, "error": None}
+                    try:
+                        result["bytes"] = getattr(session, operation)(name)
+                    except Exception as e:
+                        result["error"] = str(e)
+                    result["seconds"] = time.perf_counter() - start
+                    with lock:
+                        results.append(result)
+            finally:
+                session.close()
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(max(1, min(workers, len(names))))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        # Archivos que quedaron sin transferir porque no se pudo abrir ninguna sesión
+        while not pending.empty():
+            results.append({"file": pending.get(), "bytes": 0, "seconds": 0.0, "error": "Sin sesión disponible"})
+
+        transferred = [r for r in results if r["file"] and not r["error"]]
+        total = sum(r["bytes"] for r in transferred)
+        summary = {"files": len(transferred), "failed": len(results) - len(transferred),
+                   "bytes": total, "seconds": elapsed,
+                   "throughput": total / elapsed if elapsed > 0 else 0.0}
+        return results, summary
+
     def enter_passive_mode(self):
         """Entra en modo pasivo y devuelve el socket de datos."""
         response = self.send_command("PASV")
@@ -136,14 +581,15 @@ class FTPClient:
         data_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         data_sock.connect((ip, port))
 
-        return data_sock
+        return self.protect_data_socket(data_sock)
 
     def start(self):
         """Inicia la conexión FTP."""
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
             self.sock.connect((self.host, self.port))
-            print(self.sock.recv(8192).decode())  # Recibir el mensaje de bienvenida del servidor
+            self.reader = ftp_reply.ReplyReader(self.sock)
+            print(self.read_reply())  # Recibir el mensaje de bienvenida del servidor
         except Exception as e:
             print(f"Error de conexión: {e}")
             self.sock = None
@@ -151,9 +597,11 @@ class FTPClient:
 
     def close(self):
         """Cierra la conexión FTP."""
+        self.close_data_connection()
         if self.sock:
             self.sock.close()
             self.sock = None
+            self.reader = None
 
 if __name__ == "__main__":
     client = FTPClient()
@@ -1,24 +1,97 @@
 import streamlit as st
 from full_client import FTPClient  # Importa tu clase FTPClient modificada
+from transfer_manager import TransferManager
 import re
 import os
 import socket
 from pathlib import Path
 
 base_dir = Path.cwd()
+# Transferencias (RETR, STOR, APPE, MGET, MPUT, PGET, VERIFY) que se ejecutan a la vez en segundo plano
+TRANSFER_WORKERS = 2
+# Comandos que cambian el directorio remoto o su contenido
+REMOTE_CHANGES = {"CWD", "CDUP", "MKD", "RMD", "DELE", "RNTO", "STOU", "REIN", "USER", "PASS"}
 
 # Función para inicializar el cliente FTP
 def initialize_ftp_client():
     if 'ftp_client' not in st.session_state:
         st.session_state.ftp_client = FTPClient()  # Crea una instancia del cliente FTP
         st.session_state.ftp_client.start()  # Inicia la conexión FTP
+    if 'transfer_manager' not in st.session_state:
+        st.session_state.transfer_manager = TransferManager(st.session_state.ftp_client, TRANSFER_WORKERS, base_dir)
+
+# Función para obtener el directorio remoto actual (PWD)
+def remote_dir(ftp_client):
+    match = re.match(r'257 "(.*)"', ftp_client.send_command("PWD"))
+    return match.group(1) if match else "."
 
 # Función para actualizar la barra lateral
 def update_sidebar():
-    st.sidebar.subheader("Archivos para descargar")
-    for f in Path(base_dir).iterdir():
-        if f.is_file():
-            st.sidebar.write(f.name)
+    manager = st.session_state.transfer_manager
+    # Los listados se guardan y solo se vuelven a leer cuando cambian
+    st.sidebar.subheader("Archivos para subir")
+    for name in manager.local_listing():
+        st.sidebar.write(name)
+    ftp_client = st.session_state.ftp_client
+    if ftp_client.sock and ftp_client.credentials:
+        st.sidebar.subheader("Archivos remotos")
+        try:
+            for name in manager.remote_listing(remote_dir(ftp_client)):
+                st.sidebar.write(name)
+        except Exception as e:
+            st.sidebar.write(f"Error: {e}")
+
+# Función para mostrar el avance de las transferencias en segundo plano
+def show_transfers():
+    manager = st.session_state.transfer_manager
+    jobs = manager.list_jobs()
+    if not jobs:
+        return
+    st.subheader("Transferencias")
+    for job in jobs:
+        progress_col, cancel_col = st.columns([5, 1])
+        progress_col.progress(job.fraction(), text=job.describe())
+        if job.active() and cancel_col.button("Cancelar", key=f"cancel-{job.id}"):
+            manager.cancel(job.id)
+    if st.button("Quitar terminadas"):
+        manager.clear_finished()
+
+# Con st.fragment el panel se redibuja solo cada segundo sin volver a ejecutar la página
+if hasattr(st, "fragment"):
+    show_transfers = st.fragment(run_every=1)(show_transfers)
+
+# Función para obtener la conexión de datos del próximo comando
+def open_data_connection(ftp_client):
+    # En modo bloque se reutiliza la conexión abierta sin un nuevo PASV
+    if ftp_client.mode == 'B' and ftp_client.data_sock:
+        return ftp_client.data_sock
+
+    # Enviar el comando PASV y obtener la respuesta
+    response = ftp_client.send_command("PASV")
+    st.session_state.client_responses.insert(0, response)
+
+    if not response.startswith("227"):
+        st.session_state.client_responses.insert(0, "Error: No se pudo entrar en modo pasivo")
+        return None
+
+    # Extraer la dirección IP y el puerto de la respuesta
+    match = re.search(r'(\d+),(\d+),(\d+),(\d+),(\d+),(\d+)', response)
+    if not match:
+        st.session_state.client_responses.insert(0, "Error: No se pudo extraer la dirección IP y el puerto")
+        return None
+
+    # Construir la dirección IP y el puerto
+    ip = ".".join(match.groups()[:4])
+    port = (int(match.group(5)) << 8) + int(match.group(6))
+
+    # Crear un nuevo socket para la conexión de datos
+    data_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    data_sock.connect((ip, port))
+    # Con AUTH TLS activo la conexión de datos también va cifrada
+    data_sock = ftp_client.protect_data_socket(data_sock)
+    if ftp_client.mode == 'B':
+        ftp_client.data_sock = data_sock
+    return data_sock
 
 # Función para manejar la ejecución del comando
 def execute_command():
@@ -30,71 +103,117 @@ def execute_command():
         args = cmd_parts[1:] if len(cmd_parts) > 1 else []
 
         try:
-            if cmd in ["LIST", "RETR", "STOR", "APPE", "NLST"]:
-                # Enviar el comando PASV y obtener la respuesta
-                response = st.session_state.ftp_client.send_command("PASV")
-                st.session_state.client_responses.insert(0, response)
+            if cmd in ["RETR", "STOR", "APPE"]:
+                # Las transferencias se encolan y la interfaz sigue respondiendo mientras duran
+                ftp_client = st.session_state.ftp_client
+                if len(args) != 1:
+                    st.session_state.client_responses.insert(0, f"Uso: {cmd} <filename>")
+                elif cmd != "RETR" and not os.path.exists(args[0]):
+                    st.session_state.client_responses.insert(0, "Archivo no encontrado")
+                else:
+                    operation = {"RETR": "download", "STOR": "upload", "APPE": "append"}[cmd]
+                    job = st.session_state.transfer_manager.submit(operation, args[0], remote_dir(ftp_client))
+                    st.session_state.client_responses.insert(0, f"Transferencia #{job.id} en cola: {cmd} {args[0]}")
+
+            elif cmd == "JOBS":
+                # Estado de las transferencias en segundo plano
+                for job in st.session_state.transfer_manager.list_jobs():
+                    st.session_state.client_responses.insert(0, job.describe())
+
+            elif cmd == "CANCEL":
+                # Cancela una transferencia: CANCEL <número>
+                if len(args) != 1 or not args[0].lstrip("#").isdigit():
+                    st.session_state.client_responses.insert(0, "Uso: CANCEL <número de transferencia>")
+                elif st.session_state.transfer_manager.cancel(int(args[0].lstrip("#"))):
+                    st.session_state.client_responses.insert(0, f"Cancelando la transferencia {args[0]}")
+                else:
+                    st.session_state.client_responses.insert(0, f"La transferencia {args[0]} no está activa")
+
+            elif cmd in ["LIST", "NLST"]:
+                ftp_client = st.session_state.ftp_client
+                data_sock = open_data_connection(ftp_client)
+                if data_sock:
+                    failed = False
+                    try:
+                        path = args[0] if args else '.'
+                        response = ftp_client.send_command(cmd, path)
+                        st.session_state.client_responses.insert(0, response)
+                        if response.startswith("150"):
+                            # Los datos se leen antes de esperar el 226: con TLS el servidor
+                            # no puede terminar la transferencia sin la participación del cliente
+                            data = ftp_client.receive_listing(data_sock)
+                            st.session_state.client_responses.insert(0, data)
+                            st.session_state.client_responses.insert(0, ftp_client.wait_transfer(response))
+                    except Exception:
+                        failed = True
+                        raise
+                    finally:
+                        # En modo bloque la conexión de datos se conserva para el siguiente comando
+                        ftp_client.release_data_connection(data_sock, failed)
 
-                if not response.startswith("227"):
-                    st.session_state.client_responses.insert(0, "Error: No se pudo entrar en modo pasivo")
+            elif cmd in ["MGET", "MPUT"]:
+                # Transferencias en paralelo: MGET/MPUT <patrón>... [-j <sesiones>]
+                # Cada archivo se encola como una transferencia propia
+                manager = st.session_state.transfer_manager
+                if "-j" in args:
+                    index = args.index("-j")
+                    manager.grow(int(args[index + 1]))
+                    args = args[:index] + args[index + 2:]
+                if not args:
+                    st.session_state.client_responses.insert(0, f"Uso: {cmd} <patrón>... [-j <sesiones>]")
                 else:
-                    # Extraer la dirección IP y el puerto de la respuesta
-                    match = re.search(r'(\d+),(\d+),(\d+),(\d+),(\d+),(\d+)', response)
-                    if not match:
-                        st.session_state.client_responses.insert(0, "Error: No se pudo extraer la dirección IP y el puerto")
+                    ftp_client = st.session_state.ftp_client
+                    if cmd == "MGET":
+                        operation, names = "download", ftp_client.remote_files(args)
+                    else:
+                        operation, names = "upload", ftp_client.local_files(args)
+                    directory = remote_dir(ftp_client)
+                    jobs = [manager.submit(operation, name, directory) for name in names]
+                    if jobs:
+                        st.session_state.client_responses.insert(
+                            0, f"{cmd}: {len(jobs)} transferencias en cola (#{jobs[0].id} a #{jobs[-1].id})")
                     else:
-                        # Construir la dirección IP y el puerto
-                        ip = ".".join(match.groups()[:4])
-                        port = (int(match.group(5)) << 8) + int(match.group(6))
-
-                        # Crear un nuevo socket para la conexión de datos
-                        data_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                        data_sock.connect((ip, port))
-
-                        try:
-                            if cmd == "LIST" or cmd == "NLST":
-                                path = args[0] if args else '.'
-                                response = st.session_state.ftp_client.send_command_multiresponse(cmd, path)
-                                st.session_state.client_responses.insert(0, response)
-                                if "150" in response:
-                                    data = data_sock.recv(8192).decode()
-                                    st.session_state.client_responses.insert(0, data)
-                                data_sock.close()  # Cerrar el socket de datos
-
-                            elif cmd in ["RETR", "STOR", "APPE"]:
-                                if len(args) < 1:
-                                    st.session_state.client_responses.insert(0, f"Uso: {cmd} <filename>")
-                                else:
-                                    filename = args[0]
-                                    if cmd == "STOR":
-                                        if os.path.exists(filename):
-                                            response = st.session_state.ftp_client.send_command_and_file(data_sock, "STOR", filename)
-                                            st.session_state.client_responses.insert(0, response)
-                                        else:
-                                            st.session_state.client_responses.insert(0, "Archivo no encontrado")
-
-                                    elif cmd == "RETR":
-                                        response = st.session_state.ftp_client.send_command_multiresponse("RETR", filename)
-                                        st.session_state.client_responses.insert(0, response)
-                                        if "150" in response:
-                                            if st.session_state.ftp_client.receive_file(data_sock, filename):
-                                                st.session_state.client_responses.insert(0, "Archivo recibido exitosamente")
-                                            else:
-                                                st.session_state.client_responses.insert(0, "Error al recibir archivo")
-
-                                    elif cmd == "APPE":
-                                        if os.path.exists(filename):
-                                            response = st.session_state.ftp_client.send_command_and_file(data_sock, "APPE", filename)
-                                            st.session_state.client_responses.insert(0, response)
-                                        else:
-                                            st.session_state.client_responses.insert(0, "Archivo no encontrado")
-                        finally:
-                            data_sock.close()  # Cerrar el socket de datos
+                        st.session_state.client_responses.insert(0, f"{cmd}: ningún archivo coincide")
+
+            elif cmd == "AUTH":
+                # TLS explícito: AUTH TLS [<certificado de CA>]
+                cafile = args[1] if len(args) > 1 else None
+                response = st.session_state.ftp_client.auth_tls(cafile)
+                st.session_state.client_responses.insert(0, response)
+
+            elif cmd == "VERIFY":
+                # Compara una descarga con el archivo remoto: VERIFY <archivo> [SHA-256|MD5|CRC32]
+                if not args or len(args) > 2:
+                    st.session_state.client_responses.insert(0, "Uso: VERIFY <archivo> [algoritmo]")
+                else:
+                    ftp_client = st.session_state.ftp_client
+                    algorithm = args[1].upper() if len(args) > 1 else None
+                    job = st.session_state.transfer_manager.submit(
+                        "verify", args[0], remote_dir(ftp_client), {"algorithm": algorithm})
+                    st.session_state.client_responses.insert(0, f"Verificación #{job.id} en cola: {args[0]}")
+
+            elif cmd == "PGET":
+                # Descarga segmentada: PGET <archivo> [-j <segmentos>]
+                segments = 4
+                if "-j" in args:
+                    index = args.index("-j")
+                    segments = int(args[index + 1])
+                    args = args[:index] + args[index + 2:]
+                if len(args) != 1:
+                    st.session_state.client_responses.insert(0, "Uso: PGET <archivo> [-j <segmentos>]")
+                else:
+                    ftp_client = st.session_state.ftp_client
+                    job = st.session_state.transfer_manager.submit(
+                        "segmented", args[0], remote_dir(ftp_client), {"segments": segments})
+                    st.session_state.client_responses.insert(
+                        0, f"Transferencia #{job.id} en cola: PGET {args[0]} en {segments} segmentos")
 
             # Manejo de comandos que no requieren modo pasivo
             else:
                 response = st.session_state.ftp_client.send_command(cmd, *args)
                 st.session_state.client_responses.insert(0, response)
+                if cmd in REMOTE_CHANGES:
+                    st.session_state.transfer_manager.invalidate_remote()
                 if cmd == "QUIT":
                     st.session_state.client_responses.insert(0, "Conexión cerrada.")
                     st.session_state.ftp_client.close()
@@ -128,6 +247,7 @@ def main():
     )
         
     update_sidebar()
+    show_transfers()
 
     # Mostrar respuestas
     if 'client_responses' in st.session_state:
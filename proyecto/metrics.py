@@ -0,0 +1,193 @@
+import json
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Límites superiores (en segundos) de los intervalos de latencia de comandos
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+# Límites superiores (en bytes por segundo) de los intervalos de throughput
+THROUGHPUT_BUCKETS = (1e5, 1e6, 1e7, 5e7, 1e8, 5e8, 1e9, 5e9)
+
+class Histogram:
+    """Histograma de intervalos fijos; el último intervalo acumula todo lo que excede el mayor límite."""
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        buckets = {str(bound): n for bound, n in zip(self.bounds, self.counts)}
+        buckets["+Inf"] = self.counts[-1]
+        return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+class Metrics:
+    """
+    Métricas del servidor: cantidad y latencia por comando, bytes y throughput de las
+    transferencias, sesiones activas y sockets de datos abiertos. Cada actualización
+    es una operación corta bajo un lock, para no pesar en el camino de los comandos.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands = {}  # comando -> Histogram de latencia
+        self.bytes = {"sent": 0, "received": 0}
+        self.transfers = {"sent": 0, "received": 0}
+        self.throughput = Histogram(THROUGHPUT_BUCKETS)
+        self.gauges = {"active_sessions": 0, "data_sockets": 0}
+        self.handshakes = {}  # canal TLS ("control", "data") -> Histogram de duración del handshake
+        self.resumed = {"control": 0, "data": 0}  # Handshakes que reanudaron una sesión TLS
+        self.sources = {}  # nombre -> función que devuelve un dict con más valores (pools, cachés)
+
+    def observe_command(self, command, seconds):
+        with self.lock:
+            histogram = self.commands.get(command)
+            if histogram is None:
+                histogram = self.commands[command] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(seconds)
+
+    def observe_transfer(self, direction, nbytes, seconds):
+        with self.lock:
+            self.bytes[direction] += nbytes
+            self.transfers[direction] += 1
+            if seconds > 0:
+                self.throughput.observe(nbytes / seconds)
+
+    def observe_handshake(self, channel, seconds, resumed):
+        with self.lock:
+            histogram = self.handshakes.get(channel)
+            if histogram is None:
+                histogram = self.handshakes[channel] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(seconds)
+            if resumed:
+                self.resumed[channel] += 1
+
+    def add(self, gauge, delta):
+        with self.lock:
+            self.gauges[gauge] += delta
+
+    def register_source(self, name, source):
+        """Añade una fuente de valores que se incluye en cada instantánea"""
+        self.sources[name] = source
+
+    def snapshot(self):
+        """Devuelve todas las métricas como un dict serializable a JSON"""
+        with self.lock:
+            data = {
+                "commands": {cmd: h.snapshot() for cmd, h in self.commands.items()},
+                "bytes": dict(self.bytes),
+                "transfers": dict(self.transfers),
+                "throughput": self.throughput.snapshot(),
+                "gauges": dict(self.gauges),
+                "tls": {"handshakes": {ch: h.snapshot() for ch, h in self.handshakes.items()},
+                        "resumed": dict(self.resumed)},
+            }
+        for name, source in self.sources.items():
+            data[name] = source()
+        return data
+
+    def summary_lines(self):
+        """Resumen legible para la respuesta de SITE STATS"""
+        data = self.snapshot()
+        lines = [f"Sesiones activas: {data['gauges']['active_sessions']}",
+                 f"Sockets de datos abiertos: {data['gauges']['data_sockets']}",
+                 f"Bytes enviados: {data['bytes']['sent']} en {data['transfers']['sent']} transferencias",
+                 f"Bytes recibidos: {data['bytes']['received']} en {data['transfers']['received']} transferencias"]
+        throughput = data["throughput"]
+        if throughput["count"]:
+            lines.append(f"Throughput medio: {throughput['sum'] / throughput['count'] / 1e6:.2f} MB/s")
+        for cmd, h in sorted(data["commands"].items()):
+            lines.append(f"{cmd}: {h['count']} comandos, latencia media {h['sum'] / h['count'] * 1000:.3f} ms")
+        for channel, h in sorted(data["tls"]["handshakes"].items()):
+            lines.append(f"Handshakes TLS {channel}: {h['count']} ({data['tls']['resumed'][channel]} reanudados), "
+                         f"media {h['sum'] / h['count'] * 1000:.3f} ms")
+        for name in self.sources:
+            values = ", ".join(f"{k}={v}" for k, v in data[name].items())
+            lines.append(f"{name}: {values}")
+        return lines
+
+    def render_text(self):
+        """Exposición en texto plano con el formato de Prometheus"""
+        return render_snapshot(self.snapshot())
+
+# Claves propias de snapshot; el resto son fuentes registradas (pools, cachés)
+CORE_KEYS = ("commands", "bytes", "transfers", "throughput", "gauges", "tls")
+
+def render_snapshot(data):
+    """Convierte una instantánea (de un proceso o agregada) al formato de texto de Prometheus"""
+    out = []
+    for gauge, value in data["gauges"].items():
+        out.append(f"ftp_{gauge} {value}")
+    for direction, value in data["bytes"].items():
+        out.append(f'ftp_transfer_bytes_total{{direction="{direction}"}} {value}')
+    for direction, value in data["transfers"].items():
+        out.append(f'ftp_transfers_total{{direction="{direction}"}} {value}')
+    out.extend(histogram_lines("ftp_transfer_throughput_bytes_per_second", "", data["throughput"]))
+    for cmd, h in sorted(data["commands"].items()):
+        out.extend(histogram_lines("ftp_command_seconds", f'command="{cmd}"', h))
+    for channel, h in sorted(data["tls"]["handshakes"].items()):
+        out.extend(histogram_lines("ftp_tls_handshake_seconds", f'channel="{channel}"', h))
+    for channel, value in data["tls"]["resumed"].items():
+        out.append(f'ftp_tls_resumed_total{{channel="{channel}"}} {value}')
+    for name, values in data.items():
+        if name not in CORE_KEYS:
+            for key, value in values.items():
+                out.append(f"ftp_{name}_{key} {value}")
+    return "\n".join(out) + "\n"
+
+def merge_snapshots(snapshots):
+    """
+    Suma las instantáneas de varios procesos: contadores, gauges, histogramas (que
+    comparten intervalos) y los valores numéricos de las fuentes.
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for key, value in snapshot.items():
+            if isinstance(value, dict):
+                merged[key] = merge_snapshots([merged.get(key, {}), value])
+            elif isinstance(value, (int, float)):
+                merged[key] = merged.get(key, 0) + value
+            else:
+                merged.setdefault(key, value)
+    return merged
+
+def histogram_lines(name, labels, histogram):
+    """Líneas de un histograma en formato Prometheus (intervalos acumulados)"""
+    sep = "," if labels else ""
+    lines = []
+    cumulative = 0
+    for bound, n in histogram["buckets"].items():
+        cumulative += n
+        lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {histogram['sum']}")
+    lines.append(f"{name}_count{suffix} {histogram['count']}")
+    return lines
+
+def serve_http(metrics, host="127.0.0.1", port=9121):
+    """Expone las métricas por HTTP (/metrics en texto, /metrics.json en JSON) en un hilo aparte"""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = metrics.render_text().encode(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = json.dumps(metrics.snapshot()).encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
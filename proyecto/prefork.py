@@ -0,0 +1,164 @@
+import math
+import time
+import signal
+import logging
+import threading
+import multiprocessing
+from multiprocessing.connection import wait
+from server import ServerFTP
+from metrics import Metrics, merge_snapshots, render_snapshot, serve_http
+
+logger = logging.getLogger(__name__)
+
+# Un proceso que termina antes de este tiempo se reinicia con espera, para no girar en falso
+MIN_UPTIME = 1.0
+RESTART_DELAY = 1.0
+
+def partition_ports(ports, parts):
+    """Reparte un rango de puertos pasivos en parts rangos contiguos y disjuntos"""
+    if ports is None:
+        # Con puertos efímeros el kernel ya evita que dos procesos tomen el mismo
+        return [None] * parts
+    if len(ports) < parts:
+        raise ValueError(f"El rango pasivo tiene {len(ports)} puertos para {parts} procesos")
+    size = len(ports) // parts
+    extra = len(ports) % parts
+    slices = []
+    start = 0
+    for i in range(parts):
+        end = start + size + (1 if i < extra else 0)
+        slices.append(ports[start:end])
+        start = end
+    return slices
+
+def run_worker(host, port, options, connection):
+    """Cuerpo de cada proceso: su propio ServerFTP sobre el puerto compartido"""
+    # Ctrl+C lo gestiona el supervisor, que termina los procesos con SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    server = ServerFTP(host, port, reuse_port=True, **options)
+
+    def answer_metrics():
+        # El supervisor pide la instantánea de métricas por el pipe
+        try:
+            while connection.recv() is not None:
+                connection.send(server.metrics.snapshot())
+        except (EOFError, OSError):
+            pass
+
+    threading.Thread(target=answer_metrics, daemon=True).start()
+    server.start()
+
+class Worker:
+    """Un proceso del servidor, su rango pasivo y el pipe por el que entrega sus métricas"""
+    def __init__(self, index, pasv_ports):
+        self.index = index
+        self.pasv_ports = pasv_ports
+        self.process = None
+        self.connection = None
+        self.started = 0.0
+        self.lock = threading.Lock()
+
+    def snapshot(self, timeout=1.0):
+        """Pide las métricas al proceso; None si no responde a tiempo"""
+        with self.lock:
+            try:
+                # Respuestas que llegaron tarde a una petición anterior
+                while self.connection.poll():
+                    self.connection.recv()
+                self.connection.send(True)
+                if self.connection.poll(timeout):
+                    return self.connection.recv()
+            except (EOFError, OSError):
+                pass
+            return None
+
+class Supervisor:
+    """
+    Modo multiproceso: arranca processes copias de ServerFTP que comparten el puerto de
+    control con SO_REUSEPORT, cada una con su parte del rango pasivo, y reinicia las que
+    terminan. Los límites globales de sesiones y transferencias indicados se reparten
+    entre los procesos; sin ellos, cada proceso aplica los suyos por defecto, que dependen
+    de sus propios hilos. El límite por IP también se reparte, redondeando hacia abajo
+    para que la suma no lo supere: como el kernel distribuye las conexiones de una IP
+    entre todos los procesos, puede rechazar alguna antes de alcanzarlo en total. Las métricas de todos los
+    procesos se suman y se exponen con la misma interfaz que Metrics.
+    """
+    def __init__(self, host, port, options, processes):
+        self.host = host
+        self.port = port
+        self.options = dict(options)
+        for limit in ("max_sessions", "max_transfers"):
+            if self.options.get(limit) is not None:
+                self.options[limit] = math.ceil(self.options[limit] / processes)
+        if self.options.get("max_sessions_per_ip") is not None:
+            self.options["max_sessions_per_ip"] = max(1, self.options["max_sessions_per_ip"] // processes)
+        pasv_slices = partition_ports(self.options.pop("pasv_ports", None), processes)
+        self.workers = [Worker(i, ports) for i, ports in enumerate(pasv_slices)]
+        self.context = multiprocessing.get_context("fork")
+        self.restarts = 0
+        self.stopping = False
+
+    def spawn(self, worker):
+        parent, child = self.context.Pipe()
+        options = dict(self.options, pasv_ports=worker.pasv_ports)
+        process = self.context.Process(target=run_worker, args=(self.host, self.port, options, child),
+                                       name=f"ftp-worker-{worker.index}", daemon=True)
+        process.start()
+        child.close()
+        with worker.lock:
+            if worker.connection:
+                worker.connection.close()
+            worker.process, worker.connection, worker.started = process, parent, time.monotonic()
+        logger.info("Proceso %d iniciado (pid %d, puertos pasivos %s)", worker.index, process.pid,
+                    f"{worker.pasv_ports.start}-{worker.pasv_ports.stop - 1}" if worker.pasv_ports else "efímeros")
+
+    def run(self, metrics_port=None):
+        """Arranca los procesos y los vigila hasta recibir SIGINT o SIGTERM"""
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        for worker in self.workers:
+            self.spawn(worker)
+        if metrics_port:
+            serve_http(self, port=metrics_port)
+        try:
+            while not self.stopping:
+                sentinels = {worker.process.sentinel: worker for worker in self.workers}
+                for sentinel in wait(list(sentinels), timeout=1.0):
+                    worker = sentinels[sentinel]
+                    if self.stopping:
+                        break
+                    worker.process.join()
+                    logger.warning("Proceso %d terminó con código %s; se reinicia", worker.index,
+                                   worker.process.exitcode)
+                    if time.monotonic() - worker.started < MIN_UPTIME:
+                        time.sleep(RESTART_DELAY)
+                    self.restarts += 1
+                    self.spawn(worker)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+            for worker in self.workers:
+                worker.process.join(5)
+
+    def stop(self):
+        self.stopping = True
+        for worker in self.workers:
+            if worker.process and worker.process.is_alive():
+                worker.process.terminate()
+
+    def snapshot(self):
+        """Suma de las métricas de los procesos que responden"""
+        snapshots = [Metrics().snapshot()]
+        alive = 0
+        for worker in self.workers:
+            snapshot = worker.snapshot()
+            if snapshot is not None:
+                snapshots.append(snapshot)
+                alive += 1
+        data = merge_snapshots(snapshots)
+        data["prefork"] = {"processes": len(self.workers), "alive": alive, "restarts": self.restarts}
+        return data
+
+    def render_text(self):
+        return render_snapshot(self.snapshot())
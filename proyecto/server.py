@@ -1,13 +1,393 @@
 import socket
+import ssl
 from pathlib import Path
 import shutil
 import tempfile
 import threading
+import selectors
+import queue
+import argparse
+import io
+import time
+import logging
+import heapq
+from itertools import count
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import resource  # Solo en sistemas POSIX
+except ImportError:
+    resource = None
+import transfer
+import tls
+from cache import ContentCache, ListingCache
+from digest import ALGORITHMS, DigestIndex, Hasher
+from metrics import Metrics, serve_http
+
+logger = logging.getLogger("ftp.server")
+
+class CommandReader:
+    """
+    Separa el flujo de la conexión de control en comandos terminados en CRLF.
+    Conserva las líneas incompletas entre lecturas y encola los comandos completos,
+    de forma que un cliente puede enviar varios comandos seguidos en un mismo segmento.
+    """
+    TOO_LONG = object()  # Marca de una línea que superó el límite
+
+    def __init__(self, max_line=8192):
+        self.max_line = max_line
+        self.buffer = bytearray()
+        self.commands = deque()
+        self.discarding = False  # Descartando el resto de una línea demasiado larga
+
+    def feed(self, data):
+        """Añade los bytes recibidos y encola los comandos que queden completos"""
+        self.buffer += data
+        start = 0
+        while True:
+            end = self.buffer.find(b"\n", start)
+            if end < 0:
+                break
+            line = self.buffer[start:end]
+            start = end + 1
+            if self.discarding:
+                self.discarding = False
+                continue
+            if len(line) > self.max_line:
+                self.commands.append(self.TOO_LONG)
+                continue
+            command = line.decode(errors="replace").strip()
+            if command:
+                self.commands.append(command)
+        del self.buffer[:start]
+
+        if len(self.buffer) > self.max_line:
+            # La línea pendiente ya es demasiado larga: se descarta hasta el próximo fin de línea
+            self.buffer.clear()
+            if not self.discarding:
+                self.discarding = True
+                self.commands.append(self.TOO_LONG)
+
+    def reset(self):
+        """Descarta lo recibido y los comandos pendientes (p. ej. lo enviado en claro antes de AUTH)"""
+        self.buffer.clear()
+        self.commands.clear()
+        self.discarding = False
+
+class PassivePortPool:
+    """
+    Sockets pasivos ya enlazados y escuchando, que las sesiones toman en PASV y devuelven
+    al aceptar la conexión de datos. Con un rango de puertos todos se enlazan al inicio y
+    no se abren más; sin rango se usan puertos efímeros y se guardan hasta max_idle libres.
+    """
+    def __init__(self, host, ports=None, max_idle=32):
+        self.host = host
+        self.ports = ports
+        self.max_idle = max_idle
+        self.idle = deque()
+        self.lock = threading.Lock()
+        self.in_use = 0
+        self.open = 0  # Descriptores de socket abiertos por el pool
+        for port in ports or []:
+            try:
+                self.idle.append(self.create(port))
+            except OSError as e:
+                logger.warning("Puerto pasivo %s no disponible: %s", port, e)
+
+    def create(self, port):
+        """Crea un socket pasivo enlazado al puerto indicado (0 para uno efímero)"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, port))
+        sock.listen(1)
+        self.open += 1
+        return sock
+
+    def acquire(self):
+        """Entrega un socket pasivo libre. Lanza OSError si el rango está agotado."""
+        with self.lock:
+            if self.idle:
+                sock = self.idle.popleft()
+            elif self.ports is None:
+                sock = self.create(0)
+            else:
+                raise OSError("No quedan puertos pasivos libres")
+            self.in_use += 1
+        self.drain(sock)
+        return sock
+
+    def release(self, sock):
+        """Devuelve un socket pasivo al pool"""
+        # Una conexión que llegue tarde no debe quedar esperando al siguiente que lo use
+        self.drain(sock)
+        with self.lock:
+            self.in_use -= 1
+            if self.ports is None and len(self.idle) >= self.max_idle:
+                sock.close()
+                self.open -= 1
+            else:
+                self.idle.append(sock)
+
+    def drain(self, sock):
+        """Descarta conexiones que llegaron tarde mientras el socket estaba libre"""
+        sock.setblocking(False)
+        try:
+            while True:
+                stale, _ = sock.accept()
+                stale.close()
+        except (BlockingIOError, OSError):
+            pass
+        finally:
+            sock.setblocking(True)
+
+    def stats(self):
+        """Devuelve el uso actual del pool"""
+        with self.lock:
+            return {"in_use": self.in_use, "idle": len(self.idle), "open": self.open}
+
+def default_limits(event_loop, max_workers):
+    """
+    Límites por defecto de sesiones y transferencias según el modelo de concurrencia.
+    Con hilos cada sesión ocupa uno. En el bucle de eventos una sesión inactiva solo
+    ocupa su socket, pero cada transferencia retiene un hilo del pool mientras dura
+    (accept y E/S de datos): se les deja como mucho tres cuartas partes del pool para
+    que los comandos de las demás sesiones sigan atendiéndose.
+    """
+    if event_loop:
+        return 16384, max(1, max_workers - max_workers // 4)
+    return 1024, 256
+
+def default_digest_index(base_dir):
+    """Ruta por defecto del índice de resúmenes: junto a la raíz servida, fuera de ella
+    para que no aparezca en los listados ni se pueda descargar"""
+    base_dir = Path(base_dir).resolve()
+    return base_dir.parent / f".{base_dir.name or 'raiz'}.digests.sqlite3"
+
+class AdmissionControl:
+    """
+    Límites de sesiones totales, sesiones por IP y transferencias simultáneas.
+    Cuando se alcanza un límite el servidor rechaza la petición en lugar de degradarse.
+    """
+    def __init__(self, max_sessions=None, max_sessions_per_ip=None, max_transfers=None):
+        self.max_sessions = max_sessions
+        self.max_sessions_per_ip = max_sessions_per_ip
+        self.max_transfers = max_transfers
+        self.lock = threading.Lock()
+        self.sessions = 0
+        self.sessions_per_ip = {}
+        self.transfers = 0
+        self.rejected_sessions = 0
+        self.rejected_transfers = 0
+
+    def admit_session(self, ip):
+        """Reserva una sesión para la IP. Devuelve False si se supera algún límite."""
+        with self.lock:
+            per_ip = self.sessions_per_ip.get(ip, 0)
+            if ((self.max_sessions is not None and self.sessions >= self.max_sessions) or
+                    (self.max_sessions_per_ip is not None and per_ip >= self.max_sessions_per_ip)):
+                self.rejected_sessions += 1
+                return False
+            self.sessions += 1
+            self.sessions_per_ip[ip] = per_ip + 1
+            return True
+
+    def release_session(self, ip):
+        with self.lock:
+            self.sessions -= 1
+            if self.sessions_per_ip[ip] == 1:
+                del self.sessions_per_ip[ip]
+            else:
+                self.sessions_per_ip[ip] -= 1
+
+    def acquire_transfer(self):
+        """Reserva una transferencia. Devuelve False si ya hay demasiadas en curso."""
+        with self.lock:
+            if self.max_transfers is not None and self.transfers >= self.max_transfers:
+                self.rejected_transfers += 1
+                return False
+            self.transfers += 1
+            return True
+
+    def release_transfer(self):
+        with self.lock:
+            self.transfers -= 1
+
+    def stats(self):
+        """Devuelve la ocupación actual y los rechazos acumulados"""
+        with self.lock:
+            return {"sessions": self.sessions, "transfers": self.transfers,
+                    "rejected_sessions": self.rejected_sessions,
+                    "rejected_transfers": self.rejected_transfers}
+
+# Fases de una sesión para el vigilante de tiempos
+IDLE = "idle"          # Esperando un comando
+BUSY = "busy"          # Ejecutando un comando
+TRANSFER = "transfer"  # Moviendo datos por la conexión de datos
+CLOSED = "closed"
+
+class DataConnectionError(ConnectionError):
+    """No se pudo abrir la conexión de datos: falta PASV o el cliente no se conectó a tiempo (425)"""
+
+class TransferProgress:
+    """Cuenta los bytes de la transferencia en curso de una sesión (interfaz de transfer.Progress)"""
+    def __init__(self, client_state):
+        self.client_state = client_state
+
+    def update(self, n):
+        self.client_state.transferred += n
+
+    def finish(self):
+        pass
+
+class SessionReaper:
+    """
+    Cierra las sesiones inactivas y las transferencias detenidas. Un único hilo revisa
+    un heap de vencimientos: registrar actividad solo actualiza campos de la sesión, y
+    al vencer su entrada se comprueba si de verdad expiró o se vuelve a programar.
+    Una transferencia expira si en data_timeout segundos no movió ningún byte o se quedó
+    por debajo de min_throughput bytes/s.
+    Para expirar una sesión se cierra el socket en el que está bloqueada; el hilo que la
+    atiende responde 421 y libera sus recursos. Con el control sobre TLS la capa TLS ya no
+    admite escrituras tras el corte, así que la conexión se cierra sin el 421.
+    """
+    MESSAGES = {
+        "idle": "421 Tiempo de inactividad agotado, cerrando la conexion",
+        "stalled": "421 Transferencia detenida, cerrando la conexion",
+    }
+
+    def __init__(self, idle_timeout=300, data_timeout=60, min_throughput=0):
+        self.idle_timeout = idle_timeout
+        self.data_timeout = data_timeout
+        self.min_throughput = min_throughput
+        self.heap = []  # (vencimiento, número de entrada, sesión)
+        self.entries = count()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.sessions = 0
+        self.expired = {"idle": 0, "stalled": 0}
+        self.accept_timeouts = 0
+
+    def start(self):
+        if self.thread is None and (self.idle_timeout or self.data_timeout):
+            self.thread = threading.Thread(target=self.run, name="reaper", daemon=True)
+            self.thread.start()
+
+    def schedule(self, client_state, deadline):
+        """Programa una revisión de la sesión si es anterior a la que ya tiene (con el lock tomado).
+        La entrada anterior queda en el heap y se descarta al salir."""
+        if client_state.deadline is not None and client_state.deadline[0] <= deadline:
+            return
+        entry = (deadline, next(self.entries), client_state)
+        client_state.deadline = entry[:2]
+        heapq.heappush(self.heap, entry)
+        if self.heap[0] is entry:
+            self.condition.notify()
+
+    def watch(self, client_state):
+        """Empieza a vigilar una sesión recién admitida"""
+        with self.condition:
+            self.sessions += 1
+            self.touch(client_state, IDLE)
+            if self.idle_timeout:
+                self.schedule(client_state, client_state.activity + self.idle_timeout)
+
+    def forget(self, client_state):
+        with self.condition:
+            self.sessions -= 1
+            client_state.phase = CLOSED
+            client_state.deadline = None
+            # Las entradas de sesiones cerradas se descartan al vencer; si se acumulan
+            # demasiadas se reconstruye el heap solo con las vigentes
+            if len(self.heap) > 2 * self.sessions + 64:
+                self.heap = [entry for entry in self.heap if entry[2].deadline == entry[:2]]
+                heapq.heapify(self.heap)
+
+    def touch(self, client_state, phase):
+        """Registra actividad de la sesión y la fase en la que entra"""
+        client_state.phase = phase
+        client_state.activity = time.monotonic()
+
+    def begin_transfer(self, client_state):
+        """Marca el inicio de una transferencia. Devuelve el objeto de avance que deben
+        actualizar las funciones de transfer, o None si no se vigilan las transferencias."""
+        if not self.data_timeout:
+            return None
+        with self.condition:
+            self.touch(client_state, TRANSFER)
+            client_state.transferred = 0
+            client_state.window = (client_state.activity, 0)
+            self.schedule(client_state, client_state.activity + self.data_timeout)
+        return TransferProgress(client_state)
+
+    def end_transfer(self, client_state):
+        self.touch(client_state, BUSY)
+
+    def run(self):
+        with self.condition:
+            while True:
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                deadline, entry, client_state = self.heap[0]
+                now = time.monotonic()
+                if deadline > now:
+                    self.condition.wait(deadline - now)
+                    continue
+                heapq.heappop(self.heap)
+                if client_state.deadline != (deadline, entry):
+                    continue  # Reemplazada por una revisión anterior
+                client_state.deadline = None
+                self.review(client_state, now)
+
+    def review(self, client_state, now):
+        """Decide si una sesión vencida expira o cuándo volver a revisarla"""
+        if client_state.phase == CLOSED:
+            return
+        if client_state.phase == TRANSFER and self.data_timeout:
+            start, start_bytes = client_state.window
+            moved = client_state.transferred - start_bytes
+            if moved < max(1, self.min_throughput * (now - start)):
+                self.expire(client_state, "stalled", client_state.data_socket)
+                return
+            client_state.window = (now, client_state.transferred)
+            self.schedule(client_state, now + self.data_timeout)
+        elif client_state.phase == IDLE and self.idle_timeout:
+            deadline = client_state.activity + self.idle_timeout
+            if deadline <= now:
+                self.expire(client_state, "idle", client_state.control_socket)
+                return
+            self.schedule(client_state, deadline)
+        elif self.idle_timeout:
+            # Un comando largo que no transfiere (HASH de un archivo grande) no expira
+            self.schedule(client_state, now + self.idle_timeout)
+
+    def expire(self, client_state, reason, sock):
+        self.expired[reason] += 1
+        client_state.expired = self.MESSAGES[reason]
+        logger.warning("Sesion de %s expirada (%s)", client_state.remote_ip, reason)
+        if sock is None:
+            return
+        try:
+            # Sobre el socket base: el hilo de la sesión sigue usando la capa TLS
+            socket.socket.shutdown(sock, socket.SHUT_RD if reason == "idle" else socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def count_accept_timeout(self):
+        with self.condition:
+            self.accept_timeouts += 1
+
+    def stats(self):
+        with self.condition:
+            return {"sessions": self.sessions, "scheduled": len(self.heap),
+                    "expired_idle": self.expired["idle"], "expired_stalled": self.expired["stalled"],
+                    "accept_timeouts": self.accept_timeouts}
 
 class ClientState:
     def __init__(self, base_dir):
         self.current_user = None
         self.authenticated = False
+        self.remote_ip = None    # IP del cliente, para los límites por IP
         self.base_dir = base_dir
         self.current_dir = base_dir
         self.rename_from = None  # Para el comando RNFR/RNTO
@@ -16,11 +396,72 @@ class ClientState:
         self.structure = 'F'      # File por defecto
         self.mode = 'S'          # Stream por defecto
         self.data_socket = None
+        self.pasv_socket = None  # Socket pasivo tomado del pool con PASV
+        self.buffer = None       # Buffer de recepción reutilizable de la sesión
+        self.reader = CommandReader()  # Comandos recibidos pendientes de ejecutar
+        self.rest_offset = 0     # Punto de reinicio indicado con REST
+        self.range_end = None    # Último byte (inclusive) del rango indicado con RANG
+        self.control_socket = None  # Conexión de control; se reemplaza por la TLS tras AUTH
+        self.protection = 'C'    # Protección de la conexión de datos (PROT): [C]lear o [P]rivate
+        self.pbsz = None         # Tamaño de buffer de protección acordado con PBSZ
+        self.hash_algorithm = "SHA-256"  # Algoritmo de HASH elegido con OPTS HASH
+        self.phase = IDLE        # Fase de la sesión para SessionReaper
+        self.activity = 0.0      # Última actividad (time.monotonic)
+        self.deadline = None     # (vencimiento, entrada) de la revisión programada en el heap
+        self.transferred = 0     # Bytes de la transferencia en curso
+        self.window = None       # (inicio, bytes) de la ventana de throughput actual
+        self.expired = None      # Respuesta 421 si el vigilante expiró la sesión
 
 class ServerFTP:
-    def __init__(self, host='0.0.0.0', port=21):
+    def __init__(self, host='0.0.0.0', port=21, event_loop=False, max_workers=64,
+                 chunk_size=transfer.CHUNK_SIZE, pasv_ports=None, masquerade_address=None,
+                 listing_cache_size=256, backlog=128, max_sessions=None, max_sessions_per_ip=64,
+                 max_transfers=None, certfile=None, keyfile=None, require_tls=False,
+                 digest_index=None, hash_workers=4, content_cache_size=0,
+                 content_cache_max_file=256 * 1024, reuse_port=False, idle_timeout=300,
+                 data_timeout=60, min_throughput=0):
         self.host = host
         self.port = port
+        self.backlog = backlog  # Conexiones pendientes de accept que admite el sistema
+        self.reuse_port = reuse_port  # Compartir el puerto de control con otros procesos (SO_REUSEPORT)
+        # Sin valor, los límites dependen del modelo de concurrencia (default_limits)
+        default_sessions, transfer_limit = default_limits(event_loop, max_workers)
+        if max_sessions is None:
+            max_sessions = default_sessions
+        if max_transfers is None:
+            max_transfers = transfer_limit
+        elif event_loop and max_transfers > transfer_limit:
+            logger.warning("max_transfers=%d dejaría sin hilos a los comandos en el bucle de eventos; se limita a %d",
+                           max_transfers, transfer_limit)
+            max_transfers = transfer_limit
+        self.admission = AdmissionControl(max_sessions, max_sessions_per_ip, max_transfers)
+        self.pasv_ports = pasv_ports  # Rango de puertos pasivos (None para puertos efímeros)
+        self.masquerade_address = masquerade_address  # Dirección anunciada en PASV
+        self.pasv_pool = None
+        self.pasv_address = None
+        self.listing_cache = ListingCache(listing_cache_size)  # Listados compartidos por todas las sesiones
+        self.metrics = Metrics()
+        # Un único contexto TLS para todas las sesiones: permite reanudar sesiones en los datos
+        self.ssl_context = tls.server_context(certfile, keyfile) if certfile else None
+        self.require_tls = require_tls  # Exigir AUTH TLS antes del login y PROT P en los datos
+        self.metrics.register_source("listing_cache", self.listing_cache.stats)
+        # Contenido de archivos pequeños servido desde memoria en RETR (0 la desactiva)
+        self.content_cache = None
+        if content_cache_size:
+            self.content_cache = ContentCache(content_cache_size, content_cache_max_file)
+            self.metrics.register_source("content_cache", self.content_cache.stats)
+        self.metrics.register_source("admission", self.admission.stats)
+        # Resúmenes de archivos (HASH, XMD5...) calculados en un pool acotado y guardados entre
+        # ejecuciones del servidor. Sin ruta, el índice se ubica al arrancar junto a base_dir
+        self.hasher = Hasher(DigestIndex(str(digest_index) if digest_index else None), hash_workers)
+        self.metrics.register_source("digests", self.hasher.stats)
+        # Tiempos máximos de inactividad del control y de las conexiones de datos (0 los desactiva)
+        self.reaper = SessionReaper(idle_timeout, data_timeout, min_throughput)
+        self.metrics.register_source("reaper", self.reaper.stats)
+        self.chunk_size = chunk_size    # Tamaño de bloque de la conexión de datos
+        self.marker_interval = transfer.RESTART_MARKER_INTERVAL  # Marcadores de reinicio en MODE B
+        self.event_loop = event_loop    # Atender las sesiones desde un bucle de eventos
+        self.max_workers = max_workers  # Hilos del pool que ejecuta los comandos en modo bucle
         self.users = {
             "joel": "joel",
             "claudia": "clau"
@@ -59,8 +500,19 @@ class ServerFTP:
             "ABOR": self.handle_abor,
             "SITE": self.handle_site,
             "STAT": self.handle_stat,
-            "NLST": self.handle_nlst
+            "NLST": self.handle_nlst,
+            "SIZE": self.handle_size,
+            "RANG": self.handle_rang,
+            "AUTH": self.handle_auth,
+            "PBSZ": self.handle_pbsz,
+            "PROT": self.handle_prot,
+            "HASH": self.handle_hash,
+            "OPTS": self.handle_opts,
+            "XMD5": self.handle_xmd5,
+            "XCRC": self.handle_xcrc,
+            "XSHA256": self.handle_xsha256
         }
+        self.transfer_commands = {"RETR", "STOR", "APPE", "LIST", "NLST"}
         self.commands_help = {
             "USER": "Especifica el usuario. Sintaxis: USER <username>",
             "PASS": "Especifica la contraseña. Sintaxis: PASS <password>",
@@ -92,9 +544,19 @@ class ServerFTP:
             "ALLO": "Reserva espacio. Sintaxis: ALLO <decimal_integer> or ALLO [R <decimal_integer>]",
             "REST": "Reinicia transferencia desde punto. Sintaxis: REST <marker>",
             "ABOR": "Aborta operación en progreso. Sintaxis: ABOR",
-            "SITE": "Comandos específicos del sitio. Sintaxis: SITE <string>",
+            "SITE": "Comandos específicos del sitio: SITE STATS muestra las métricas. Sintaxis: SITE <string>",
             "STAT": "Retorna estado actual. Sintaxis: STAT [<pathname>]",
-            "NLST": "Lista nombres de archivos. Sintaxis: NLST [<pathname>]"
+            "NLST": "Lista nombres de archivos. Sintaxis: NLST [<pathname>]",
+            "SIZE": "Retorna el tamaño de un archivo. Sintaxis: SIZE <pathname>",
+            "RANG": "Limita el próximo RETR a un rango de bytes (inclusive); RANG 1 0 lo anula. Sintaxis: RANG <start> <end>",
+            "AUTH": "Protege la conexión de control con TLS. Sintaxis: AUTH TLS",
+            "PBSZ": "Tamaño del buffer de protección (siempre 0 con TLS). Sintaxis: PBSZ 0",
+            "PROT": "Protección de la conexión de datos, [C]lear o [P]rivate. Sintaxis: PROT <level>",
+            "HASH": "Resumen de un archivo con el algoritmo elegido (SHA-256 por defecto). Sintaxis: HASH <pathname>",
+            "OPTS": "Opciones de comandos: OPTS HASH [SHA-256|MD5|CRC32] elige el algoritmo de HASH. Sintaxis: OPTS <command> [<options>]",
+            "XMD5": "Resumen MD5 de un archivo. Sintaxis: XMD5 <pathname>",
+            "XCRC": "CRC32 de un archivo. Sintaxis: XCRC <pathname>",
+            "XSHA256": "Resumen SHA-256 de un archivo. Sintaxis: XSHA256 <pathname>"
         }
         self.structs = {
             "F": "File",
@@ -109,57 +571,282 @@ class ServerFTP:
 
     def start(self):
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if self.reuse_port:
+            # El kernel reparte las conexiones entrantes entre los procesos que comparten el puerto
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         server_socket.bind((self.host, self.port))
-        server_socket.listen(5)
-        print(f"Servidor FTP iniciado en {self.host}:{self.port}")
+        server_socket.listen(self.backlog)
+        logger.info("Servidor FTP iniciado en %s:%s", self.host, self.port)
+
+        # La dirección anunciada en PASV se resuelve una única vez al arrancar
+        self.pasv_pool = PassivePortPool(self.host, self.pasv_ports)
+        self.metrics.register_source("pasv_pool", self.pasv_pool.stats)
+        self.pasv_address = self.masquerade_address or self.resolve_pasv_address()
+        if self.hasher.index.path is None:
+            self.hasher.index.path = str(default_digest_index(self.base_dir))
+        logger.info("Índice de resúmenes: %s", self.hasher.index.path)
+        logger.info("PASV anunciará %s (%d sockets pasivos preparados)", self.pasv_address, self.pasv_pool.stats()['idle'])
+        self.reaper.start()
+
+        if self.event_loop:
+            self.serve_event_loop(server_socket)
+            return
 
         while True:
             client_socket, client_address = server_socket.accept()
-            print(f"Cliente conectado: {client_address}")
+            logger.info("Cliente conectado: %s", client_address)
             
             # Crear un nuevo estado para el cliente
-            client_state = ClientState(self.base_dir)
+            client_state = self.admit_session(client_socket, client_address)
+            if client_state is None:
+                continue
             
             # Crear un nuevo hilo para manejar al cliente
             client_thread = threading.Thread(target=self.handle_client, args=(client_socket, client_state))
             client_thread.start()
 
     def handle_client(self, client_socket, client_state):
-        client_socket.send(b"220 Bienvenido al servidor FTP\r\n")
+        self.metrics.add("active_sessions", 1)
+        try:
+            client_socket.send(b"220 Bienvenido al servidor FTP\r\n")
+        except OSError:
+            # El cliente se fue antes del saludo: se libera su cupo igualmente
+            self.close_session(client_socket, client_state)
+            return
         client_state.rename_from = None  # Para el comando RNFR/RNTO
         client_state.authenticated = False  # Reiniciar el estado de autenticación para cada cliente
         
         while True:
             try:
-                data = client_socket.recv(8192).decode().strip()
+                # Tras AUTH TLS la sesión continúa sobre el socket TLS
+                client_socket = client_state.control_socket
+                data = client_socket.recv(8192)
                 if not data:
                     break
 
-                print(f"Comando recibido: {data}")
-                cmd_parts = data.split()
-                cmd = cmd_parts[0].upper()
-                args = cmd_parts[1:] if len(cmd_parts) > 1 else []
-
-                # Comandos permitidos sin autenticación
-                if cmd in ["HELP", "QUIT", "USER", "PASS"]:
-                    self.commands[cmd](client_socket, client_state, args)
-                else:
-                    # Verificar si el cliente está autenticado
-                    if not client_state.authenticated:
-                        client_socket.send(b"530 Por favor inicie sesion con USER y PASS.\r\n")
-                        continue
-
-                    # Ejecutar el comando si está autenticado
-                    if cmd in self.commands:
-                        self.commands[cmd](client_socket, client_state, args)
-                    else:
-                        client_socket.send(b"502 Comando no implementado\r\n")
+                client_state.reader.feed(data)
+                if self.run_pending_commands(client_socket, client_state):
+                    break
 
             except Exception as e:
-                print(f"Error: {e}")
+                logger.error("Error: %s", e)
                 break
 
+        self.close_session(client_state.control_socket, client_state)
+
+    def admit_session(self, client_socket, client_address):
+        """Crea el estado de una sesión nueva si los límites lo permiten.
+        Si no, responde 421, cierra la conexión y devuelve None."""
+        ip = client_address[0]
+        if not self.admission.admit_session(ip):
+            logger.warning("Sesion rechazada por limite de conexiones: %s", client_address)
+            try:
+                client_socket.send(b"421 Demasiadas conexiones, intente mas tarde\r\n")
+            except OSError:
+                pass
+            client_socket.close()
+            return None
+        # Las respuestas son escrituras pequeñas seguidas (150 ... 226): sin Nagle no
+        # esperan el ACK retrasado del cliente
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client_state = ClientState(self.base_dir)
+        client_state.remote_ip = ip
+        client_state.control_socket = client_socket
+        self.reaper.watch(client_state)
+        return client_state
+
+    def close_session(self, client_socket, client_state):
+        """Libera todos los recursos de una sesión"""
+        self.reaper.forget(client_state)
+        if client_state.expired:
+            try:
+                client_socket.send(f"{client_state.expired}\r\n".encode())
+            except OSError:
+                pass
+        self.close_data_connection(client_state, force=True)
+        self.release_passive_socket(client_state)
         client_socket.close()
+        self.admission.release_session(client_state.remote_ip)
+        self.metrics.add("active_sessions", -1)
+
+    def resolve_pasv_address(self):
+        """Obtiene la dirección IP del servidor que se anuncia en PASV"""
+        if self.host not in ("", "0.0.0.0"):
+            return self.host
+        return socket.gethostbyname(socket.gethostname())
+
+    def run_pending_commands(self, client_socket, client_state):
+        """Ejecuta en orden los comandos encolados de la sesión.
+        Devuelve True si la sesión debe cerrarse (QUIT o expirada)."""
+        commands = client_state.reader.commands
+        self.reaper.touch(client_state, BUSY)
+        while commands:
+            command = commands.popleft()
+            if command is CommandReader.TOO_LONG:
+                client_socket.send(b"500 Linea de comando demasiado larga\r\n")
+            elif self.dispatch_command(client_socket, client_state, command):
+                return True
+            if client_state.expired:
+                return True
+            # AUTH TLS reemplaza el socket de control para los comandos siguientes
+            client_socket = client_state.control_socket
+        self.reaper.touch(client_state, IDLE)
+        return False
+
+    def dispatch_command(self, client_socket, client_state, data):
+        """Ejecuta un comando a través de la tabla self.commands.
+        Devuelve True si la sesión debe cerrarse (QUIT)."""
+        logger.debug("Comando recibido: %s", data)
+        cmd_parts = data.split()
+        cmd = cmd_parts[0].upper()
+        args = cmd_parts[1:] if len(cmd_parts) > 1 else []
+
+        start = time.perf_counter()
+        try:
+            # Con TLS obligatorio, las credenciales no pueden viajar en claro
+            if self.require_tls and cmd in ["USER", "PASS"] and not self.is_tls(client_socket):
+                client_socket.send(b"530 Se requiere AUTH TLS antes de iniciar sesion\r\n")
+                return False
+
+            # Comandos permitidos sin autenticación
+            if cmd in ["HELP", "QUIT", "USER", "PASS", "AUTH", "PBSZ", "PROT"]:
+                return self.commands[cmd](client_socket, client_state, args)
+
+            # Verificar si el cliente está autenticado
+            if not client_state.authenticated:
+                client_socket.send(b"530 Por favor inicie sesion con USER y PASS.\r\n")
+                return False
+
+            # Las transferencias ocupan un cupo limitado mientras duran
+            if cmd in self.transfer_commands:
+                if cmd != "RETR":
+                    # RANG solo vale para RETR: cualquier otra transferencia lo anula
+                    self.clear_range(client_state)
+                if cmd not in ("RETR", "STOR", "APPE"):
+                    # REST tampoco se aplica a un listado: LIST y NLST lo consumen sin usarlo
+                    self.take_rest_offset(client_state)
+                if self.require_tls and client_state.protection != 'P':
+                    client_socket.send(b"521 Se requiere PROT P para transferir datos\r\n")
+                    return False
+                if not self.admission.acquire_transfer():
+                    client_socket.send(b"425 Demasiadas transferencias simultaneas, intente mas tarde\r\n")
+                    return False
+                try:
+                    return self.commands[cmd](client_socket, client_state, args)
+                finally:
+                    self.admission.release_transfer()
+
+            # Ejecutar el comando si está autenticado
+            if cmd in self.commands:
+                return self.commands[cmd](client_socket, client_state, args)
+
+            client_socket.send(b"502 Comando no implementado\r\n")
+            return False
+        finally:
+            self.metrics.observe_command(cmd if cmd in self.commands else "OTRO",
+                                         time.perf_counter() - start)
+
+    # Modo bucle de eventos
+    def serve_event_loop(self, server_socket):
+        """Multiplexa todas las conexiones de control en un único bucle (selectors).
+        Una sesión inactiva no ocupa ningún hilo: solo cuando llega un comando se
+        ejecuta en un pool acotado, que es donde ocurre la E/S de archivos y de datos.
+        Las conexiones de datos no pasan por el bucle: cada transferencia retiene un hilo
+        del pool mientras dura, así que el pool acota las transferencias simultáneas."""
+        self.raise_file_limit()
+        self.selector = selectors.DefaultSelector()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.ready_sessions = queue.SimpleQueue()  # Sesiones que vuelven al bucle
+        self.wakeup_recv, self.wakeup_send = socket.socketpair()
+        self.wakeup_recv.setblocking(False)
+
+        server_socket.setblocking(False)
+        self.selector.register(server_socket, selectors.EVENT_READ)
+        self.selector.register(self.wakeup_recv, selectors.EVENT_READ)
+        logger.info("Modo bucle de eventos (%d hilos de trabajo)", self.max_workers)
+
+        try:
+            while True:
+                for key, _ in self.selector.select():
+                    if key.fileobj is server_socket:
+                        self.accept_event(server_socket)
+                    elif key.fileobj is self.wakeup_recv:
+                        self.resume_sessions()
+                    else:
+                        # La sesión sale del bucle mientras un hilo atiende su comando
+                        self.selector.unregister(key.fileobj)
+                        self.executor.submit(self.serve_command, key.fileobj, key.data)
+        finally:
+            self.executor.shutdown(wait=False)
+            self.selector.close()
+
+    def raise_file_limit(self):
+        """Sube el límite de descriptores abiertos para que quepan todas las sesiones admitidas:
+        en el bucle de eventos cada sesión inactiva conserva su socket de control"""
+        if resource is None:
+            return
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        # Control de cada sesión, datos y socket pasivo de cada transferencia, y un margen
+        wanted = self.admission.max_sessions + 2 * self.admission.max_transfers + 256
+        if soft != resource.RLIM_INFINITY and soft < wanted:
+            soft = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+        if soft != resource.RLIM_INFINITY and soft < wanted:
+            logger.warning("Límite de descriptores %d: no alcanza para %d sesiones", soft,
+                           self.admission.max_sessions)
+
+    def accept_event(self, server_socket):
+        """Acepta las conexiones pendientes y las registra en el bucle"""
+        while True:
+            try:
+                client_socket, client_address = server_socket.accept()
+            except BlockingIOError:
+                return
+            logger.info("Cliente conectado: %s", client_address)
+            client_socket.setblocking(True)
+
+            client_state = self.admit_session(client_socket, client_address)
+            if client_state is None:
+                continue
+            self.metrics.add("active_sessions", 1)
+            try:
+                client_socket.send(b"220 Bienvenido al servidor FTP\r\n")
+            except OSError:
+                self.close_session(client_socket, client_state)
+                continue
+            self.selector.register(client_socket, selectors.EVENT_READ, client_state)
+
+    def resume_sessions(self):
+        """Vuelve a registrar en el bucle las sesiones cuyo comando terminó"""
+        try:
+            while self.wakeup_recv.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while not self.ready_sessions.empty():
+            client_socket, client_state = self.ready_sessions.get()
+            self.selector.register(client_socket, selectors.EVENT_READ, client_state)
+
+    def serve_command(self, client_socket, client_state):
+        """Lee y ejecuta desde el pool los comandos disponibles en una sesión"""
+        try:
+            while True:
+                data = client_socket.recv(8192)
+                if not data:
+                    break
+                client_state.reader.feed(data)
+                if self.run_pending_commands(client_socket, client_state):
+                    break
+                client_socket = client_state.control_socket
+                # select no ve los datos que TLS ya descifró y guarda en su buffer
+                if self.is_tls(client_socket) and client_socket.pending():
+                    continue
+                self.ready_sessions.put((client_socket, client_state))
+                self.wakeup_send.send(b"\0")
+                return
+        except Exception as e:
+            logger.error("Error: %s", e)
+        self.close_session(client_state.control_socket, client_state)
 
     # Implementación de comandos
     def handle_user(self, client_socket, client_state, args):
@@ -203,7 +890,7 @@ class ServerFTP:
             return
         try:
             if args[0] == '..':
-                print('Entrando en CDUP desde CWD')
+                logger.debug("Entrando en CDUP desde CWD")
                 self.handle_cdup(client_socket, client_state, [])
                 return
         
@@ -222,8 +909,8 @@ class ServerFTP:
             client_socket.send(b"501 Sintaxis invalida\r\n")
             return
         try:
-            print("Este directorio: ", client_state.current_dir)
-            print("Directorio base: ", client_state.base_dir)
+            logger.debug("Este directorio: %s", client_state.current_dir)
+            logger.debug("Directorio base: %s", client_state.base_dir)
             if client_state.current_dir == client_state.base_dir:
                 client_socket.send(b"550 No se puede subir mas. Ya estas en el directorio raiz.\r\n")
             else:
@@ -249,18 +936,23 @@ class ServerFTP:
             client_socket.send(b"150 Iniciando transferencia\r\n")
             
             # Aceptar la conexión de datos
-            client_state.data_socket, _ = client_state.pasv_socket.accept()
+            data_socket = self.accept_data_connection(client_state)
             
             # Enviar la lista de archivos
-            files = "\r\n".join(str(f.name) for f in path.iterdir())
-            client_state.data_socket.send(files.encode())
+            files = "\r\n".join(name for name, _ in self.listing_cache.listing(path.resolve()))
+            sent = self.send_payload(client_state, data_socket, files.encode())
             
-            client_socket.send(b"226 Transferencia completa\r\n")
-            client_state.data_socket.close()  # Cerrar el socket de datos
-            client_state.data_socket = None  # Reiniciar el socket de datos
+            client_socket.send(f"226 Transferencia completa ({sent} bytes)\r\n".encode())
+        except DataConnectionError as e:
+            logger.error("Error en LIST: %s", e)
+            self.close_data_connection(client_state, force=True)
+            client_socket.send(b"425 No se pudo abrir la conexion de datos\r\n")
         except Exception as e:
-            print(f"Error en LIST: {e}")
+            logger.error("Error en LIST: %s", e)
+            self.close_data_connection(client_state, force=True)
             client_socket.send(b"550 Error al listar archivos\r\n")
+        finally:
+            self.close_data_connection(client_state)
 
     def handle_mkd(self, client_socket, client_state, args):
         if not args or len(args) > 1:
@@ -269,6 +961,7 @@ class ServerFTP:
         try:
             new_dir = (client_state.current_dir / args[0])
             new_dir.mkdir(parents=True, exist_ok=True)
+            self.invalidate_path(new_dir)
             client_socket.send(f"257 \"{new_dir}\" creado\r\n".encode())
         except:
             client_socket.send(b"550 Error al crear directorio\r\n")
@@ -281,6 +974,7 @@ class ServerFTP:
             dir_to_remove = (client_state.current_dir / args[0])
             if dir_to_remove.is_dir():
                 shutil.rmtree(dir_to_remove)
+                self.invalidate_path(dir_to_remove, recursive=True)
                 client_socket.send(b"250 Directorio eliminado\r\n")
             else:
                 client_socket.send(b"550 No es un directorio\r\n")
@@ -295,6 +989,7 @@ class ServerFTP:
             file_to_delete = (client_state.current_dir / args[0])
             if file_to_delete.is_file():
                 file_to_delete.unlink()
+                self.invalidate_path(file_to_delete)
                 client_socket.send(b"250 Archivo eliminado\r\n")
             else:
                 client_socket.send(b"550 No es un archivo\r\n")
@@ -322,12 +1017,24 @@ class ServerFTP:
         try:
             new_path = (client_state.current_dir / args[0])
             client_state.rename_from.rename(new_path)
+            self.invalidate_path(client_state.rename_from, recursive=True)
+            self.invalidate_path(new_path)
             client_socket.send(b"250 Archivo renombrado exitosamente\r\n")
         except:
             client_socket.send(b"553 Error al renombrar\r\n")
         finally:
             client_state.rename_from = None
 
+    def invalidate_path(self, path, recursive=False):
+        """Descarta el listado en caché del directorio que contiene path y el contenido
+        en caché de path. Con recursive también todo lo que hay debajo (RMD, RNTO)."""
+        path = path.resolve()
+        self.listing_cache.invalidate(path.parent)
+        if recursive:
+            self.listing_cache.invalidate(path, recursive=True)
+        if self.content_cache:
+            self.content_cache.invalidate(path, recursive)
+
     def handle_syst(self, client_socket, client_state, args):
         if args:
             client_socket.send(b"501 Sintaxis invalida\r\n")
@@ -380,6 +1087,8 @@ class ServerFTP:
         client_state.current_user = None
         client_state.authenticated = False
         client_state.current_dir = client_state.base_dir
+        client_state.rest_offset = 0
+        client_state.range_end = None
         client_socket.send(b"220 Conexion al servidor reiniciada\r\n")
 
     def handle_port(self, client_socket, client_state, args):
@@ -388,25 +1097,185 @@ class ServerFTP:
     def handle_pasv(self, client_socket, client_state, args):
         """Maneja el comando PASV (modo pasivo)"""
         try:
-            # Cerrar el socket pasivo anterior si existe
-            if hasattr(self, 'pasv_socket'):
-                client_state.pasv_socket.close()
+            # Un PASV nuevo descarta la conexión de datos que se mantenía en modo bloque
+            self.close_data_connection(client_state, force=True)
+
+            # Devolver al pool el socket pasivo anterior de la sesión si existe
+            self.release_passive_socket(client_state)
             
-            # Crear un nuevo socket para la conexión de datos
-            client_state.pasv_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client_state.pasv_socket.bind((self.host, 0))  # Puerto aleatorio
-            client_state.pasv_socket.listen(1)
+            # Tomar un socket pasivo ya enlazado del pool
+            client_state.pasv_socket = self.pasv_pool.acquire()
             _, port = client_state.pasv_socket.getsockname()
 
-            # Obtener la dirección IP del servidor
-            ip = socket.gethostbyname(socket.gethostname())
+            ip = self.pasv_address
             port_bytes = [str(port >> 8), str(port & 0xff)]
             response = f"227 Entering Passive Mode ({','.join(ip.split('.'))},{','.join(port_bytes)})\r\n"
             client_socket.send(response.encode())
         except Exception as e:
-            print(f"Error en PASV: {e}")
+            logger.error("Error en PASV: %s", e)
             client_socket.send(b"500 Error en modo pasivo\r\n")
 
+    def accept_data_connection(self, client_state):
+        """Acepta la conexión de datos sobre el socket pasivo de la sesión.
+        En modo bloque se reutiliza la conexión que dejó abierta la transferencia anterior."""
+        if client_state.mode == 'B' and client_state.data_socket:
+            return client_state.data_socket
+        if client_state.pasv_socket is None:
+            raise DataConnectionError("No hay conexión de datos, use PASV primero")
+        # Un cliente que no llega a conectarse no retiene el hilo (el pool restablece el
+        # modo bloqueante al recibir el socket de vuelta)
+        timeout = self.reaper.data_timeout or None
+        deadline = time.monotonic() + timeout if timeout else None
+        client_state.pasv_socket.settimeout(timeout)
+        try:
+            while True:
+                data_socket, address = client_state.pasv_socket.accept()
+                # El socket pasivo pudo servir antes a otra sesión: solo se acepta la conexión
+                # que llega desde la IP del cliente (RFC 2577)
+                if address[0] == client_state.remote_ip:
+                    break
+                logger.warning("Conexion de datos de %s rechazada: la sesion es de %s",
+                               address[0], client_state.remote_ip)
+                data_socket.close()
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise socket.timeout()
+                    client_state.pasv_socket.settimeout(remaining)
+        except socket.timeout:
+            self.reaper.count_accept_timeout()
+            self.release_passive_socket(client_state)
+            raise DataConnectionError("El cliente no abrió la conexión de datos a tiempo")
+        self.metrics.add("data_sockets", 1)
+        # Una vez aceptada la conexión el socket pasivo vuelve al pool
+        self.release_passive_socket(client_state)
+        client_state.data_socket = data_socket
+        if client_state.protection == 'P':
+            data_socket.settimeout(self.reaper.data_timeout or None)
+            client_state.data_socket = self.tls_handshake(data_socket, "data")
+            client_state.data_socket.settimeout(None)
+        return client_state.data_socket
+
+    def release_passive_socket(self, client_state):
+        """Devuelve al pool el socket pasivo de la sesión si tiene uno"""
+        if client_state.pasv_socket is not None:
+            self.pasv_pool.release(client_state.pasv_socket)
+            client_state.pasv_socket = None
+
+    def close_data_connection(self, client_state, force=False):
+        """Cierra la conexión de datos al terminar una transferencia.
+        En modo bloque el fin de archivo lo marca un bloque EOF, así que la conexión
+        se mantiene abierta salvo que se fuerce el cierre (error, PASV o cambio de modo)."""
+        if client_state.data_socket and (force or client_state.mode != 'B'):
+            client_state.data_socket.close()
+            client_state.data_socket = None
+            self.metrics.add("data_sockets", -1)
+
+    def is_tls(self, sock):
+        """Indica si el socket ya está protegido con TLS"""
+        return self.ssl_context is not None and isinstance(sock, ssl.SSLSocket)
+
+    def tls_handshake(self, sock, channel):
+        """Envuelve un socket con el contexto TLS compartido y registra la duración del handshake
+        y si se reanudó una sesión anterior"""
+        start = time.perf_counter()
+        tls_socket = self.ssl_context.wrap_socket(sock, server_side=True)
+        self.metrics.observe_handshake(channel, time.perf_counter() - start, tls_socket.session_reused)
+        return tls_socket
+
+    def send_data(self, client_state, data_socket, f, offset=0, count=None):
+        """Envía un archivo (o count bytes desde offset) por la conexión de datos según el modo de la sesión"""
+        start = time.perf_counter()
+        marker_interval = self.marker_interval
+        if client_state.transfer_type == 'A':
+            # Los marcadores contarían bytes ya convertidos, que no valen como posición para REST
+            f = transfer.AsciiReader(f)
+            marker_interval = None
+        progress = self.reaper.begin_transfer(client_state)
+        try:
+            if client_state.mode == 'B':
+                sent = transfer.send_file_blocks(data_socket, f, offset, count,
+                                                 marker_interval=marker_interval, progress=progress)
+            else:
+                # Copia cero salvo en TYPE A; con vigilancia, el avance se informa varias veces
+                # por ventana del vigilante sea cual sea el ritmo del cliente
+                sent = transfer.send_file(data_socket, f, offset, count, chunk_size=self.chunk_size,
+                                          zero_copy=client_state.transfer_type != 'A', progress=progress,
+                                          window_seconds=self.reaper.data_timeout / 4 if progress else None)
+        finally:
+            self.end_transfer(client_state)
+        self.metrics.observe_transfer("sent", sent, time.perf_counter() - start)
+        return sent
+
+    def send_payload(self, client_state, data_socket, payload):
+        """Envía un listado ya construido según el modo de la sesión"""
+        start = time.perf_counter()
+        progress = self.reaper.begin_transfer(client_state)
+        try:
+            if client_state.mode == 'B':
+                sent = transfer.send_file_blocks(data_socket, io.BytesIO(payload), progress=progress)
+            else:
+                sent = transfer.send_bytes(data_socket, payload, progress, transfer.PROGRESS_STEP)
+        finally:
+            self.end_transfer(client_state)
+        self.metrics.observe_transfer("sent", sent, time.perf_counter() - start)
+        return sent
+
+    def send_cached(self, client_state, data_socket, data, offset=0, count=None):
+        """Envía un archivo de la caché de contenido sin copiar el buffer compartido"""
+        if client_state.transfer_type == 'A':
+            return self.send_data(client_state, data_socket, io.BytesIO(data), offset, count)
+        start = time.perf_counter()
+        progress = self.reaper.begin_transfer(client_state)
+        try:
+            if client_state.mode == 'B':
+                # BytesIO sobre bytes comparte la memoria mientras no se escriba en él
+                sent = transfer.send_file_blocks(data_socket, io.BytesIO(data), offset, count,
+                                                 marker_interval=self.marker_interval, progress=progress)
+            else:
+                end = len(data) if count is None else offset + count
+                sent = transfer.send_bytes(data_socket, memoryview(data)[offset:end], progress,
+                                          transfer.PROGRESS_STEP)
+        finally:
+            self.end_transfer(client_state)
+        self.metrics.observe_transfer("sent", sent, time.perf_counter() - start)
+        return sent
+
+    def receive_data(self, client_socket, client_state, data_socket, f):
+        """Recibe un archivo por la conexión de datos según el modo de la sesión"""
+        start = time.perf_counter()
+        buffer = self.session_buffer(client_state)
+        if client_state.transfer_type == 'A':
+            f = transfer.AsciiWriter(f)
+        progress = self.reaper.begin_transfer(client_state)
+        try:
+            if client_state.mode == 'B':
+                def on_marker(marker):
+                    # Se confirma cada marcador del cliente con la posición equivalente del servidor
+                    client_socket.send(f"110 MARK {marker} = {f.tell()}\r\n".encode())
+                received = transfer.receive_file_blocks(data_socket, f, buffer, on_marker, progress)
+            else:
+                received = transfer.receive_file(data_socket, f, buffer, progress)
+        finally:
+            self.end_transfer(client_state)
+        if client_state.transfer_type == 'A':
+            f.finish()
+        self.metrics.observe_transfer("received", received, time.perf_counter() - start)
+        return received
+
+    def end_transfer(self, client_state):
+        """Cierra la vigilancia de una transferencia. Si el vigilante la cortó por detenida,
+        falla aunque el corte se haya leído como un fin de datos normal."""
+        self.reaper.end_transfer(client_state)
+        if client_state.expired:
+            raise ConnectionError(client_state.expired)
+
+    def session_buffer(self, client_state):
+        """Devuelve el buffer de recepción de la sesión, creándolo la primera vez"""
+        if client_state.buffer is None:
+            client_state.buffer = memoryview(bytearray(self.chunk_size))
+        return client_state.buffer
+
     def handle_type(self, client_socket, client_state, args):
         if not args or len(args) > 1:
             client_socket.send(b"501 Sintaxis: TYPE {A,E,I,L}\r\n")
@@ -438,6 +1307,8 @@ class ServerFTP:
         
         mode_code = args[0].upper()
         if mode_code in ['S', 'B', 'C']:
+            if mode_code != client_state.mode:
+                self.close_data_connection(client_state, force=True)
             client_state.mode = mode_code
             client_socket.send(f"200 Modo establecido a {self.modes[mode_code]}\r\n".encode())
         else:
@@ -448,30 +1319,42 @@ class ServerFTP:
         if not args or len(args) > 1:
             client_socket.send(b"501 Sintaxis: RETR filename\r\n")
             return
+        count = self.take_range_count(client_state)
+        offset = self.take_rest_offset(client_state)
         try:
             file_path = client_state.current_dir / args[0]
-            if file_path.is_file():
+            cached = self.content_cache.get(file_path) if self.content_cache else None
+            if cached is not None or file_path.is_file():
+                if (offset > len(cached) if cached is not None
+                        else self.invalid_restart(file_path, offset)):
+                    client_socket.send(b"554 Punto de reinicio fuera del archivo\r\n")
+                    return
                 client_socket.send(b"150 Iniciando transferencia\r\n")
                 
                 # Aceptar la conexión de datos
-                client_state.data_socket, _ = client_state.pasv_socket.accept()
+                data_socket = self.accept_data_connection(client_state)
                 
-                # Enviar el archivo
-                with open(file_path, 'rb') as f:
-                    while True:
-                        data = f.read()
-                        if not data:
-                            break
-                        client_state.data_socket.send(data)
+                # Enviar el archivo desde el punto de reinicio, hasta el final del rango si lo hay
+                if cached is not None:
+                    sent = self.send_cached(client_state, data_socket, cached, offset, count)
+                else:
+                    with open(file_path, 'rb') as f:
+                        sent = self.send_data(client_state, data_socket, f, offset, count)
+                logger.info("RETR %s: %d bytes enviados", file_path.name, sent)
                 
-                client_socket.send(b"226 Transferencia completa\r\n")
-                client_state.data_socket.close()
-                client_state.data_socket = None
+                client_socket.send(f"226 Transferencia completa ({sent} bytes)\r\n".encode())
             else:
                 client_socket.send(b"550 Archivo no encontrado\r\n")
+        except DataConnectionError as e:
+            logger.error("Error en RETR: %s", e)
+            self.close_data_connection(client_state, force=True)
+            client_socket.send(b"425 No se pudo abrir la conexion de datos\r\n")
         except Exception as e:
-            print(f"Error en RETR: {e}")
+            logger.error("Error en RETR: %s", e)
+            self.close_data_connection(client_state, force=True)
             client_socket.send(b"550 Error al leer archivo\r\n")
+        finally:
+            self.close_data_connection(client_state)
 
     def handle_stor(self, client_socket, client_state, args):
         """Maneja el comando STOR (subir archivo)"""
@@ -479,42 +1362,41 @@ class ServerFTP:
             client_socket.send(b"501 Sintaxis: STOR filename\r\n")
             return
 
+        offset = self.take_rest_offset(client_state)
         try:
             # Verificar si el archivo ya existe
             file_path = client_state.current_dir / Path(args[0]).name
+            if self.invalid_restart(file_path, offset):
+                client_socket.send(b"554 Punto de reinicio fuera del archivo\r\n")
+                return
 
             # Indicar al cliente que está listo para recibir el archivo
             client_socket.send(b"150 Listo para recibir datos\r\n")
-            print(b"150 Listo para recibir datos\r\n")
 
             # Aceptar la conexión de datos
-            client_state.data_socket, _ = client_state.pasv_socket.accept()
-            print("Conexión de datos establecida.")
-
-            # Recibir el archivo
-            with open(file_path, 'wb') as f:
-                print("Leyendo el archivo")
-                while True:
-                    data = client_state.data_socket.recv(8192)
-                    print("Data recibida")
-                    if b'EOF' in data:
-                        f.write(data.split(b'EOF')[0])  # Escribe los datos antes del marcador EOF
-                        break
-                    f.write(data)
-                    print("Data escrita")
+            data_socket = self.accept_data_connection(client_state)
+
+            # Recibir el archivo hasta que el cliente cierre la conexión de datos
+            with self.open_for_upload(file_path, offset) as f:
+                received = self.receive_data(client_socket, client_state, data_socket, f)
+            self.invalidate_path(file_path)
+            logger.info("STOR %s: %d bytes recibidos", file_path.name, received)
 
             # Confirmar que la transferencia se completó
-            client_socket.send(b"226 Transferencia completa\r\n")
+            client_socket.send(f"226 Transferencia completa ({received} bytes)\r\n".encode())
 
+        except DataConnectionError as e:
+            logger.error("Error en STOR: %s", e)
+            self.close_data_connection(client_state, force=True)
+            client_socket.send(b"425 No se pudo abrir la conexion de datos\r\n")
         except Exception as e:
-            print(f"Error en STOR: {e}")
+            logger.error("Error en STOR: %s", e)
+            self.close_data_connection(client_state, force=True)
             client_socket.send(b"550 Error al almacenar archivo\r\n")
 
         finally:
             # Cerrar el socket de datos
-            if client_state.data_socket:
-                client_state.data_socket.close()
-                client_state.data_socket = None
+            self.close_data_connection(client_state)
 
     def handle_stou(self, client_socket, client_state, args):
         if args:
@@ -523,6 +1405,7 @@ class ServerFTP:
         try:
             temp_file = tempfile.NamedTemporaryFile(delete=False, dir=client_state.current_dir)
             temp_name = Path(temp_file.name).name
+            self.invalidate_path(Path(temp_file.name))
             client_socket.send(f"250 Archivo será almacenado como {temp_name}\r\n".encode())
             temp_file.close()
         except:
@@ -532,40 +1415,230 @@ class ServerFTP:
         if not args or len(args) > 1:
             client_socket.send(b"501 Sintaxis: APPE filename\r\n")
             return
+        offset = self.take_rest_offset(client_state)
         try:
             file_path = client_state.current_dir / Path(args[0]).name
-            mode = 'ab' if file_path.exists() else 'wb'
+            if self.invalid_restart(file_path, offset):
+                client_socket.send(b"554 Punto de reinicio fuera del archivo\r\n")
+                return
             
             client_socket.send(b"150 Listo para recibir datos\r\n")
             
-            client_state.data_socket, _ = client_state.pasv_socket.accept()
-            print("Conexión de datos establecida.")
-
-            with open(file_path, mode) as f:
-                print("Leyendo el archivo")
-                while True:
-                    data = client_state.data_socket.recv(8192)
-                    print("Data recibida")
-                    if b'EOF' in data:
-                        f.write(data.split(b'EOF')[0])  # Escribe los datos antes del marcador EOF
-                        break
-                    f.write(data)
-                    print("Data escrita")
+            data_socket = self.accept_data_connection(client_state)
+
+            with self.open_for_upload(file_path, offset, append=True) as f:
+                received = self.receive_data(client_socket, client_state, data_socket, f)
+            self.invalidate_path(file_path)
+            logger.info("APPE %s: %d bytes recibidos", file_path.name, received)
             
-            client_socket.send(b"226 Transferencia completa\r\n")
-        except:
+            client_socket.send(f"226 Transferencia completa ({received} bytes)\r\n".encode())
+        except DataConnectionError as e:
+            logger.error("Error en APPE: %s", e)
+            self.close_data_connection(client_state, force=True)
+            client_socket.send(b"425 No se pudo abrir la conexion de datos\r\n")
+        except Exception as e:
+            logger.error("Error en APPE: %s", e)
+            self.close_data_connection(client_state, force=True)
             client_socket.send(b"550 Error al anexar al archivo\r\n")
+        finally:
+            self.close_data_connection(client_state)
 
     def handle_allo(self, client_socket, client_state, args):
         client_socket.send(b"502 ALLO no implementado\r\n")
 
     def handle_rest(self, client_socket, client_state, args):
-        client_socket.send(b"502 REST no implementado\r\n")
+        """Maneja el comando REST (punto de reinicio de la próxima transferencia)"""
+        if len(args) != 1 or not args[0].isdigit():
+            client_socket.send(b"501 Sintaxis: REST <offset>\r\n")
+            return
+        client_state.rest_offset = int(args[0])
+        client_state.range_end = None
+        client_socket.send(f"350 Reiniciando en {client_state.rest_offset}. Envie RETR, STOR o APPE\r\n".encode())
+
+    def take_rest_offset(self, client_state):
+        """Devuelve el punto de reinicio pendiente y lo consume junto con el rango"""
+        offset, client_state.rest_offset = client_state.rest_offset, 0
+        client_state.range_end = None
+        return offset
+
+    def handle_auth(self, client_socket, client_state, args):
+        """Maneja el comando AUTH (TLS explícito en la conexión de control, RFC 4217)"""
+        if len(args) != 1:
+            client_socket.send(b"501 Sintaxis: AUTH TLS\r\n")
+            return
+        if args[0].upper() not in ("TLS", "TLS-C", "SSL"):
+            client_socket.send(b"504 Mecanismo de seguridad no soportado\r\n")
+            return
+        if self.ssl_context is None:
+            client_socket.send(b"431 TLS no esta configurado en el servidor\r\n")
+            return
+        if self.is_tls(client_socket):
+            client_socket.send(b"503 La conexion ya esta protegida\r\n")
+            return
+        client_socket.send(b"234 Iniciando negociacion TLS\r\n")
+        # Lo que el cliente haya enviado en claro detrás de AUTH no se ejecuta
+        client_state.reader.reset()
+        try:
+            client_state.control_socket = self.tls_handshake(client_socket, "control")
+        except (OSError, ValueError) as e:
+            logger.warning("Handshake TLS fallido: %s", e)
+            return True
+        # Una sesión protegida empieza sin autenticar
+        client_state.current_user = None
+        client_state.authenticated = False
+
+    def handle_pbsz(self, client_socket, client_state, args):
+        """Maneja el comando PBSZ (tamaño del buffer de protección)"""
+        if len(args) != 1 or not args[0].isdigit():
+            client_socket.send(b"501 Sintaxis: PBSZ 0\r\n")
+            return
+        if not self.is_tls(client_socket):
+            client_socket.send(b"503 Use AUTH TLS primero\r\n")
+            return
+        # TLS es un flujo: el único tamaño posible es 0
+        client_state.pbsz = 0
+        client_socket.send(b"200 PBSZ=0\r\n")
+
+    def handle_prot(self, client_socket, client_state, args):
+        """Maneja el comando PROT (protección de la conexión de datos)"""
+        if len(args) != 1:
+            client_socket.send(b"501 Sintaxis: PROT {C,P}\r\n")
+            return
+        if client_state.pbsz is None:
+            client_socket.send(b"503 Use PBSZ primero\r\n")
+            return
+        level = args[0].upper()
+        if level in ('C', 'P'):
+            if level == 'C' and self.require_tls:
+                client_socket.send(b"534 La politica del servidor exige PROT P\r\n")
+                return
+            # La conexión de datos abierta en modo bloque se negoció con el nivel anterior
+            if level != client_state.protection:
+                self.close_data_connection(client_state, force=True)
+            client_state.protection = level
+            client_socket.send(f"200 Proteccion de datos establecida a {level}\r\n".encode())
+        elif level in ('S', 'E'):
+            client_socket.send(b"536 Nivel de proteccion no soportado\r\n")
+        else:
+            client_socket.send(b"504 Nivel de proteccion desconocido\r\n")
+
+    def handle_opts(self, client_socket, client_state, args):
+        """Maneja el comando OPTS. Soporta OPTS HASH [<algoritmo>]"""
+        if not args or args[0].upper() != "HASH" or len(args) > 2:
+            client_socket.send(b"501 Opcion no soportada\r\n")
+            return
+        if len(args) == 2:
+            algorithm = args[1].upper()
+            if algorithm not in ALGORITHMS:
+                client_socket.send(f"501 Algoritmos disponibles: {';'.join(ALGORITHMS)}\r\n".encode())
+                return
+            client_state.hash_algorithm = algorithm
+        client_socket.send(f"200 {client_state.hash_algorithm}\r\n".encode())
+
+    def file_digest(self, client_socket, client_state, args, algorithm):
+        """Calcula (o toma del índice) el resumen del archivo indicado.
+        Responde el error y devuelve None si no se puede."""
+        if not args or len(args) > 1:
+            client_socket.send(b"501 Sintaxis: <comando> <pathname>\r\n")
+            return None
+        file_path = client_state.current_dir / args[0]
+        if not file_path.is_file():
+            client_socket.send(b"550 Archivo no encontrado\r\n")
+            return None
+        try:
+            return file_path, self.hasher.digest(file_path, algorithm)
+        except OSError as e:
+            logger.error("Error calculando %s de %s: %s", algorithm, file_path, e)
+            client_socket.send(b"450 No se pudo leer el archivo\r\n")
+            return None
+
+    def handle_hash(self, client_socket, client_state, args):
+        """Maneja el comando HASH (draft-bryan-ftpext-hash): algoritmo, rango, resumen y nombre"""
+        result = self.file_digest(client_socket, client_state, args, client_state.hash_algorithm)
+        if result:
+            file_path, digest = result
+            last = max(file_path.stat().st_size - 1, 0)
+            client_socket.send(f"213 {client_state.hash_algorithm} 0-{last} {digest} {args[0]}\r\n".encode())
+
+    def handle_xmd5(self, client_socket, client_state, args):
+        result = self.file_digest(client_socket, client_state, args, "MD5")
+        if result:
+            client_socket.send(f"250 {result[1]}\r\n".encode())
+
+    def handle_xcrc(self, client_socket, client_state, args):
+        result = self.file_digest(client_socket, client_state, args, "CRC32")
+        if result:
+            client_socket.send(f"250 {result[1]}\r\n".encode())
+
+    def handle_xsha256(self, client_socket, client_state, args):
+        result = self.file_digest(client_socket, client_state, args, "SHA-256")
+        if result:
+            client_socket.send(f"250 {result[1]}\r\n".encode())
+
+    def handle_rang(self, client_socket, client_state, args):
+        """Maneja el comando RANG (rango de bytes del próximo RETR, como en draft-bryan-ftp-range)"""
+        if len(args) != 2 or not all(arg.isdigit() for arg in args):
+            client_socket.send(b"501 Sintaxis: RANG <start> <end>\r\n")
+            return
+        start, end = int(args[0]), int(args[1])
+        if (start, end) == (1, 0):
+            client_state.rest_offset = 0
+            client_state.range_end = None
+            client_socket.send(b"350 Rango anulado\r\n")
+            return
+        if end < start:
+            client_socket.send(b"501 El final del rango es menor que el inicio\r\n")
+            return
+        client_state.rest_offset = start
+        client_state.range_end = end
+        client_socket.send(f"350 Rango {start}-{end}. Envie RETR\r\n".encode())
+
+    def take_range_count(self, client_state):
+        """Cantidad de bytes del rango pendiente (None si no hay rango); no lo consume"""
+        if client_state.range_end is None:
+            return None
+        return client_state.range_end - client_state.rest_offset + 1
+
+    def clear_range(self, client_state):
+        """Anula el rango pendiente de RANG; un REST pendiente se conserva"""
+        if client_state.range_end is not None:
+            client_state.rest_offset = 0
+            client_state.range_end = None
+
+    def invalid_restart(self, file_path, offset):
+        """Indica si el punto de reinicio queda fuera del archivo"""
+        return offset > 0 and (not file_path.is_file() or offset > file_path.stat().st_size)
+
+    def open_for_upload(self, file_path, offset, append=False):
+        """Abre el archivo destino de una subida, posicionado en el punto de reinicio"""
+        if offset:
+            f = open(file_path, 'r+b')
+            f.seek(offset)
+            return f
+        return open(file_path, 'ab' if append and file_path.exists() else 'wb')
+
+    def handle_size(self, client_socket, client_state, args):
+        """Maneja el comando SIZE (tamaño de un archivo)"""
+        if not args or len(args) > 1:
+            client_socket.send(b"501 Sintaxis: SIZE <pathname>\r\n")
+            return
+        file_path = client_state.current_dir / args[0]
+        if file_path.is_file():
+            client_socket.send(f"213 {file_path.stat().st_size}\r\n".encode())
+        else:
+            client_socket.send(b"550 Archivo no encontrado\r\n")
 
     def handle_abor(self, client_socket, client_state ,args):
         client_socket.send(b"226 ABOR procesado\r\n")
 
     def handle_site(self, client_socket, client_state, args):
+        """Maneja el comando SITE. Soporta SITE STATS (métricas del servidor)"""
+        if args and args[0].upper() == "STATS":
+            response = "211-Estadisticas del servidor\r\n"
+            response += "".join(f"    {line}\r\n" for line in self.metrics.summary_lines())
+            response += "211 Fin de las estadisticas\r\n"
+            client_socket.send(response.encode())
+            return
         client_socket.send(b"200 Comando SITE no soportado\r\n")
 
     def handle_stat(self, client_socket, client_state, args):
@@ -577,6 +1650,8 @@ class ServerFTP:
             response = "211-Estado del servidor FTP\r\n"
             response += f"    Usuario: {client_state.current_user}\r\n"
             response += f"    Directorio actual: {client_state.current_dir}\r\n"
+            pool = self.pasv_pool.stats()
+            response += f"    Sockets pasivos: {pool['in_use']} en uso, {pool['idle']} libres, {pool['open']} abiertos\r\n"
             response += "211 Fin del estado\r\n"
             
         else:
@@ -595,7 +1670,7 @@ class ServerFTP:
             elif target_path.is_dir():
                 response += f"    Tipo: Directorio\r\n"
                 response += f"    Permisos: {self.get_permissions(target_path)}\r\n"
-                response += f"    Archivos: {len(list(target_path.iterdir()))}\r\n"
+                response += f"    Archivos: {len(self.listing_cache.listing(target_path.resolve()))}\r\n"
             response += "213 Fin del estado.\r\n"
         client_socket.send(response.encode())
         
@@ -623,19 +1698,77 @@ class ServerFTP:
             client_socket.send(b"150 Iniciando transferencia\r\n")
             
             # Aceptar la conexión de datos
-            client_state.data_socket, _ = client_state.pasv_socket.accept()
+            data_socket = self.accept_data_connection(client_state)
             
             # Enviar la lista de archivos
-            files = "\r\n".join(str(f.name) for f in path.iterdir() if f.is_file())
-            client_state.data_socket.send(files.encode())
+            files = "\r\n".join(name for name, is_file in self.listing_cache.listing(path.resolve()) if is_file)
+            sent = self.send_payload(client_state, data_socket, files.encode())
             
-            client_socket.send(b"226 Transferencia completa\r\n")
-            client_state.data_socket.close()  # Cerrar el socket de datos
-            client_state.data_socket = None  # Reiniciar el socket de datos
+            client_socket.send(f"226 Transferencia completa ({sent} bytes)\r\n".encode())
+        except DataConnectionError as e:
+            logger.error("Error en NLST: %s", e)
+            self.close_data_connection(client_state, force=True)
+            client_socket.send(b"425 No se pudo abrir la conexion de datos\r\n")
         except Exception as e:
-            print(f"Error en NLST: {e}")
+            logger.error("Error en NLST: %s", e)
+            self.close_data_connection(client_state, force=True)
             client_socket.send(b"550 Error al listar archivos\r\n")
+        finally:
+            self.close_data_connection(client_state)
 
 if __name__ == "__main__":
-    server = ServerFTP()
-    server.start()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Servidor FTP en Python")
+    parser.add_argument("--host", default="0.0.0.0", help="Dirección en la que escucha el servidor")
+    parser.add_argument("-p", "--port", type=int, default=21, help="Puerto de control")
+    parser.add_argument("--event-loop", action="store_true", help="Atender las conexiones de control desde un bucle de eventos (las de datos siguen ocupando un hilo de --workers)")
+    parser.add_argument("--workers", type=int, default=64, help="Hilos del pool en modo bucle de eventos; cada transferencia ocupa uno, así que también limitan las transferencias simultáneas")
+    parser.add_argument("--chunk-size", type=int, default=transfer.CHUNK_SIZE, help="Tamaño de bloque de las transferencias")
+    parser.add_argument("--pasv-ports", help="Rango de puertos pasivos, por ejemplo 30000-30009")
+    parser.add_argument("--masquerade", help="Dirección IP anunciada en las respuestas PASV")
+    parser.add_argument("--listing-cache", type=int, default=256, help="Directorios guardados en la caché de listados")
+    parser.add_argument("--backlog", type=int, default=128, help="Conexiones pendientes admitidas por listen")
+    parser.add_argument("--max-sessions", type=int, help="Sesiones simultáneas en total (por defecto 1024 con hilos y 16384 en bucle de eventos)")
+    parser.add_argument("--max-sessions-per-ip", type=int, default=64, help="Sesiones simultáneas por IP (con --processes, en total entre todos)")
+    parser.add_argument("--max-transfers", type=int, help="Transferencias de datos simultáneas (por defecto 256 con hilos y 3/4 de --workers en bucle de eventos)")
+    parser.add_argument("--metrics-port", type=int, help="Puerto local en el que se exponen las métricas por HTTP")
+    parser.add_argument("--log-level", default="INFO", help="Nivel de logging (DEBUG, INFO, WARNING, ERROR)")
+    parser.add_argument("--certfile", help="Certificado PEM para AUTH TLS")
+    parser.add_argument("--keyfile", help="Clave privada PEM del certificado (si no está en --certfile)")
+    parser.add_argument("--require-tls", action="store_true", help="Exigir AUTH TLS para el login y PROT P para los datos")
+    parser.add_argument("--digest-index", help="Base sqlite3 de resúmenes de HASH (por defecto .<directorio>.digests.sqlite3 junto al directorio servido)")
+    parser.add_argument("--hash-workers", type=int, default=4, help="Hilos que calculan resúmenes")
+    parser.add_argument("--content-cache", type=int, default=0, help="MiB de la caché de contenido de RETR (0 la desactiva)")
+    parser.add_argument("--content-cache-max-file", type=int, default=256, help="KiB máximos de un archivo en la caché de contenido")
+    parser.add_argument("--idle-timeout", type=int, default=300, help="Segundos sin comandos tras los que se cierra una sesión (0 sin límite)")
+    parser.add_argument("--data-timeout", type=int, default=60, help="Segundos para abrir la conexión de datos y ventana para detectar transferencias detenidas (0 sin límite)")
+    parser.add_argument("--min-throughput", type=int, default=0, help="Bytes/s mínimos de una transferencia en cada ventana de --data-timeout")
+    parser.add_argument("--processes", type=int, default=1, help="Procesos que comparten el puerto de control (SO_REUSEPORT)")
+    argvs = parser.parse_args()
+
+    logging.basicConfig(level=argvs.log_level.upper(), format="%(asctime)s %(levelname)s %(message)s")
+
+    pasv_ports = None
+    if argvs.pasv_ports:
+        first, last = (int(p) for p in argvs.pasv_ports.split("-"))
+        pasv_ports = range(first, last + 1)
+
+    options = dict(event_loop=argvs.event_loop, max_workers=argvs.workers,
+                   chunk_size=argvs.chunk_size, pasv_ports=pasv_ports, masquerade_address=argvs.masquerade,
+                   listing_cache_size=argvs.listing_cache, backlog=argvs.backlog,
+                   max_sessions=argvs.max_sessions, max_sessions_per_ip=argvs.max_sessions_per_ip,
+                   max_transfers=argvs.max_transfers, certfile=argvs.certfile, keyfile=argvs.keyfile,
+                   require_tls=argvs.require_tls, digest_index=argvs.digest_index,
+                   hash_workers=argvs.hash_workers, content_cache_size=argvs.content_cache * 1024 * 1024,
+                   content_cache_max_file=argvs.content_cache_max_file * 1024,
+                   idle_timeout=argvs.idle_timeout, data_timeout=argvs.data_timeout,
+                   min_throughput=argvs.min_throughput)
+
+    if argvs.processes > 1:
+        # Modo multiproceso: un supervisor y un ServerFTP por proceso
+        from prefork import Supervisor
+        Supervisor(argvs.host, argvs.port, options, argvs.processes).run(argvs.metrics_port)
+    else:
+        server = ServerFTP(argvs.host, argvs.port, **options)
+        if argvs.metrics_port:
+            serve_http(server.metrics, port=argvs.metrics_port)
+        server.start()
\ No newline at end of file
@@ -0,0 +1,28 @@
+import ssl
+
+def server_context(certfile, keyfile=None):
+    """
+    Contexto TLS único del servidor, compartido por todas las conexiones de control
+    y de datos. Al ser el mismo contexto, las conexiones de datos pueden reanudar la
+    sesión TLS de su conexión de control con un ticket en vez de un handshake completo.
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.load_cert_chain(certfile, keyfile)
+    return context
+
+def client_context(cafile=None):
+    """Contexto TLS del cliente; cafile permite confiar en un certificado propio del servidor"""
+    context = ssl.create_default_context(cafile=cafile)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    return context
+
+def wrap_data_socket(control_socket, data_socket, server_hostname):
+    """
+    Protege una conexión de datos (PROT P) reanudando la sesión TLS de la conexión
+    de control. El handshake se difiere hasta el primer envío o recepción, que ocurre
+    después de que el servidor responde 150 y acepta la conexión.
+    """
+    return control_socket.context.wrap_socket(data_socket, server_hostname=server_hostname,
+                                              session=control_socket.session,
+                                              do_handshake_on_connect=False)
@@ -0,0 +1,303 @@
+import os
+import ssl
+import socket
+import sys
+import time
+
+# Tamaño por defecto de los bloques que se mueven por la conexión de datos
+CHUNK_SIZE = 256 * 1024
+# Con informe de avance, sendfile se llama por tramos de este tamaño
+PROGRESS_WINDOW = 8 * 1024 * 1024
+# Avance mínimo que se informa cuando importa detectar pronto una transferencia detenida
+# (un registro TLS)
+PROGRESS_STEP = 16 * 1024
+
+class Cancelled(Exception):
+    """Un objeto de avance interrumpió la transferencia porque se pidió cancelarla"""
+
+class Progress:
+    """
+    Avance de una transferencia: bytes, throughput y tiempo restante estimado.
+    Las actualizaciones son baratas; el texto se escribe como mucho una vez cada
+    interval segundos, sobre la misma línea de la terminal.
+    """
+    def __init__(self, total=None, out=None, interval=0.5):
+        self.total = total
+        self.out = out or sys.stderr
+        self.interval = interval
+        self.done = 0
+        self.start = time.monotonic()
+        self.last = self.start
+
+    def update(self, n):
+        self.done += n
+        now = time.monotonic()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.out.write("\r" + self.line(now))
+            self.out.flush()
+
+    def finish(self):
+        """Escribe la línea final con el throughput medio"""
+        self.out.write("\r" + self.line(time.monotonic()) + "\n")
+        self.out.flush()
+
+    def line(self, now):
+        elapsed = now - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        text = f"{self.done / 1e6:.1f} MB"
+        if self.total:
+            text += f" de {self.total / 1e6:.1f} MB ({self.done * 100 // self.total}%)"
+        text += f" a {rate / 1e6:.2f} MB/s"
+        if self.total and rate and self.done < self.total:
+            text += f", quedan {(self.total - self.done) / rate:.0f} s"
+        return text
+
+def send_file(sock, f, offset=0, count=None, chunk_size=CHUNK_SIZE, zero_copy=True, progress=None,
+              window_seconds=None):
+    """
+    Envía por sock el contenido de un archivo abierto en binario y devuelve los bytes enviados.
+    Usa la copia cero del kernel (socket.sendfile) siempre que se pueda y, si no
+    (TLS o una transferencia que hay que transformar), envía por bloques con memoria constante.
+    Con progress, sendfile se llama por tramos de PROGRESS_WINDOW bytes. Con window_seconds,
+    el avance se informa al menos cada ese tiempo aproximadamente: cada tramo se ajusta al
+    ritmo medido en el anterior, entre PROGRESS_STEP y PROGRESS_WINDOW bytes.
+    """
+    step = PROGRESS_STEP if window_seconds else None
+    if not zero_copy or isinstance(sock, ssl.SSLSocket):
+        return send_chunks(sock, f, offset, count, chunk_size, progress, step)
+    if progress is None:
+        return sock.sendfile(f, offset, count)
+    window = step or PROGRESS_WINDOW
+    total = 0
+    while count is None or total < count:
+        start = time.monotonic()
+        n = sock.sendfile(f, offset + total, window if count is None else min(window, count - total))
+        if not n:
+            break
+        total += n
+        progress.update(n)
+        if window_seconds:
+            elapsed = time.monotonic() - start
+            rate = n / elapsed if elapsed > 0 else PROGRESS_WINDOW
+            window = int(min(PROGRESS_WINDOW, max(PROGRESS_STEP, rate * window_seconds)))
+    return total
+
+def send_chunks(sock, f, offset=0, count=None, chunk_size=CHUNK_SIZE, progress=None, step=None):
+    """Envía un archivo por bloques reutilizando un único buffer. Devuelve los bytes enviados.
+    Con step, el avance se informa cada step bytes en vez de cada bloque."""
+    f.seek(offset)
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    total = 0
+    while count is None or total < count:
+        size = chunk_size if count is None else min(chunk_size, count - total)
+        n = f.readinto(view[:size])
+        if not n:
+            break
+        if progress and step:
+            for start in range(0, n, step):
+                part = view[start:min(start + step, n)]
+                sock.sendall(part)
+                progress.update(len(part))
+        else:
+            sock.sendall(view[:n])
+            if progress:
+                progress.update(n)
+        total += n
+    return total
+
+def send_bytes(sock, data, progress=None, chunk_size=CHUNK_SIZE):
+    """Envía un payload ya construido en memoria (LIST, NLST) y devuelve los bytes enviados."""
+    if progress is None:
+        sock.sendall(data)
+        return len(data)
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        part = view[start:start + chunk_size]
+        sock.sendall(part)
+        progress.update(len(part))
+    return len(view)
+
+def end_stream(sock):
+    """
+    Indica el fin de un envío en modo stream cerrando la escritura, y espera a que el
+    receptor cierre. Si al cerrar quedaran datos sin leer (por ejemplo los tickets de
+    sesión que manda un servidor TLS 1.3), el sistema enviaría un RST y el receptor
+    podría descartar el final del archivo.
+    """
+    sock.shutdown(socket.SHUT_WR)
+    while sock.recv(4096):
+        pass
+
+def receive_file(sock, f, buffer, progress=None):
+    """
+    Recibe datos por sock hasta que el emisor cierra la conexión (modo stream del RFC 959)
+    y los escribe en f. buffer es un memoryview reutilizable sobre el que se hace recv_into.
+    Devuelve los bytes recibidos.
+    """
+    total = 0
+    while True:
+        n = sock.recv_into(buffer)
+        if not n:
+            break
+        f.write(buffer[:n])
+        total += n
+        if progress:
+            progress.update(n)
+    return total
+
+# TYPE A (RFC 959 sección 3.1.1.1): en la conexión de datos las líneas terminan en CRLF
+NETWORK_NEWLINE = b"\r\n"
+LOCAL_NEWLINE = os.linesep.encode()
+
+class LineEndings:
+    """
+    Convierte los finales de línea de un flujo por bloques. Acepta LF y CRLF mezclados
+    y los deja todos como newline. Trabaja con replace sobre el bloque entero; un CR al
+    final de un bloque se guarda hasta ver si el siguiente empieza con LF.
+    """
+    def __init__(self, newline):
+        self.newline = newline
+        self.pending = b""  # CR del final del bloque anterior
+
+    def translate(self, data):
+        data = self.pending + data if self.pending else bytes(data)
+        if data.endswith(b"\r"):
+            data, self.pending = data[:-1], b"\r"
+        else:
+            self.pending = b""
+        data = data.replace(b"\r\n", b"\n")
+        if self.newline != b"\n":
+            data = data.replace(b"\n", self.newline)
+        return data
+
+    def flush(self):
+        """Devuelve el CR pendiente al terminar el flujo"""
+        data, self.pending = self.pending, b""
+        return data
+
+class AsciiReader:
+    """
+    Envuelve un archivo abierto en binario y lo entrega con finales CRLF para enviarlo
+    en TYPE A. Tiene seek y readinto, que es lo que usan send_chunks y send_file_blocks.
+    """
+    def __init__(self, f):
+        self.f = f
+        self.encoder = LineEndings(NETWORK_NEWLINE)
+        self.ready = memoryview(b"")  # Datos ya convertidos que no cupieron en la última lectura
+
+    def seek(self, offset):
+        self.f.seek(offset)
+        self.encoder = LineEndings(NETWORK_NEWLINE)
+        self.ready = memoryview(b"")
+
+    def readinto(self, view):
+        while not self.ready:
+            raw = self.f.read(len(view))
+            if not raw:
+                self.ready = memoryview(self.encoder.flush())
+                break
+            self.ready = memoryview(self.encoder.translate(raw))
+        n = min(len(view), len(self.ready))
+        view[:n] = self.ready[:n]
+        self.ready = self.ready[n:]
+        return n
+
+class AsciiWriter:
+    """
+    Envuelve un archivo abierto en binario y escribe lo recibido en TYPE A con los
+    finales de línea locales. Hay que llamar a finish al terminar la transferencia.
+    """
+    def __init__(self, f, newline=LOCAL_NEWLINE):
+        self.f = f
+        self.decoder = LineEndings(newline)
+
+    def write(self, data):
+        self.f.write(self.decoder.translate(data))
+        return len(data)
+
+    def tell(self):
+        return self.f.tell()
+
+    def finish(self):
+        self.f.write(self.decoder.flush())
+
+# Modo bloque (MODE B, RFC 959 sección 3.4.2): cada bloque lleva una cabecera de
+# 3 bytes con el descriptor y la cantidad de bytes de datos que le siguen
+BLOCK_EOR = 0x80
+BLOCK_EOF = 0x40
+BLOCK_ERRORS = 0x20
+BLOCK_RESTART = 0x10
+MAX_BLOCK = 0xFFFF
+RESTART_MARKER_INTERVAL = 4 * 1024 * 1024
+
+def block_header(descriptor, count):
+    """Construye la cabecera de un bloque"""
+    return bytes((descriptor, count >> 8, count & 0xFF))
+
+def send_file_blocks(sock, f, offset=0, count=None, marker_interval=None, progress=None):
+    """
+    Envía un archivo en modo bloque terminando con un bloque EOF, sin cerrar la conexión,
+    para que pueda reutilizarse en la siguiente transferencia. Cada marker_interval bytes
+    se intercala un marcador de reinicio con la posición en el archivo, válida para REST.
+    Devuelve los bytes de datos enviados.
+    """
+    f.seek(offset)
+    buffer = bytearray(3 + MAX_BLOCK)
+    view = memoryview(buffer)
+    total = 0
+    next_marker = marker_interval
+    while count is None or total < count:
+        size = MAX_BLOCK if count is None else min(MAX_BLOCK, count - total)
+        n = f.readinto(view[3:3 + size])
+        if not n:
+            break
+        view[:3] = block_header(0, n)
+        sock.sendall(view[:3 + n])
+        total += n
+        if progress:
+            progress.update(n)
+        if marker_interval and total >= next_marker:
+            marker = str(offset + total).encode()
+            sock.sendall(block_header(BLOCK_RESTART, len(marker)) + marker)
+            next_marker += marker_interval
+    sock.sendall(block_header(BLOCK_EOF, 0))
+    return total
+
+def recv_exact_into(sock, view):
+    """Llena view completo desde sock. Lanza ConnectionError si la conexión se cierra antes."""
+    received = 0
+    while received < len(view):
+        n = sock.recv_into(view[received:])
+        if not n:
+            raise ConnectionError("Conexión de datos cerrada en mitad de un bloque")
+        received += n
+
+def receive_file_blocks(sock, f, buffer, on_marker=None, progress=None):
+    """
+    Recibe un archivo en modo bloque hasta el bloque con descriptor EOF y lo escribe en f.
+    Los marcadores de reinicio no se escriben: se entregan a on_marker como texto.
+    Devuelve los bytes de datos recibidos.
+    """
+    header = memoryview(bytearray(3))
+    total = 0
+    while True:
+        recv_exact_into(sock, header)
+        descriptor = header[0]
+        count = (header[1] << 8) | header[2]
+        while count:
+            # Un bloque puede ser mayor que el buffer: se recibe por partes
+            part = buffer[:min(count, len(buffer))]
+            recv_exact_into(sock, part)
+            if descriptor & BLOCK_RESTART:
+                if on_marker:
+                    on_marker(bytes(part).decode(errors="replace"))
+            else:
+                f.write(part)
+                total += len(part)
+                if progress:
+                    progress.update(len(part))
+            count -= len(part)
+        if descriptor & BLOCK_EOF:
+            return total
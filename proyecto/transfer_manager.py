@@ -0,0 +1,243 @@
+import os
+import re
+import queue
+import threading
+import time
+from itertools import count
+from cache import ListingCache
+from transfer import Cancelled
+
+# Estados de una transferencia en segundo plano
+QUEUED = "en cola"
+RUNNING = "en curso"
+DONE = "completada"
+FAILED = "error"
+CANCELLED = "cancelada"
+
+# Segundos sin trabajos tras los que un hilo cierra su sesión con el servidor
+SESSION_IDLE = 30
+
+class Job:
+    """
+    Una transferencia encolada. Hace de objeto de avance (la misma interfaz que
+    transfer.Progress) para la sesión que la ejecuta: cada update suma bytes y, si se
+    pidió cancelar, interrumpe la transferencia.
+    """
+    def __init__(self, job_id, operation, name, remote_dir, options=None):
+        self.id = job_id
+        self.operation = operation    # download, segmented, verify, upload o append
+        self.name = name              # Archivo remoto (download, segmented, verify) o ruta local (upload, append)
+        self.remote_dir = remote_dir  # Directorio remoto de la sesión que la encoló
+        self.options = options or {}  # segments (segmented) o algorithm (verify)
+        self.state = QUEUED
+        self.total = None
+        self.done = 0
+        self.initial = 0  # Bytes que ya había de una descarga que se reanuda
+        self.remote_before = None    # Tamaño del archivo remoto antes de un APPE (None si no se sabe)
+        self.remote_created = False  # El APPE crea el archivo remoto (no existía)
+        self.error = None
+        self.result = None  # Resumen comprobado de un verify
+        self.start = None
+        self.end = None
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()  # Los segmentos de una descarga avanzan desde varios hilos
+
+    def update(self, n):
+        # Los n bytes ya se transfirieron: cuentan aunque se cancele
+        with self.lock:
+            self.done += n
+        if self.cancel_event.is_set():
+            raise Cancelled()
+
+    def finish(self):
+        pass
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def active(self):
+        return self.state in (QUEUED, RUNNING)
+
+    def fraction(self):
+        """Parte completada entre 0 y 1 (0 si no se conoce el tamaño)"""
+        if self.state == DONE:
+            return 1.0
+        if not self.total:
+            return 0.0
+        return min(1.0, self.done / self.total)
+
+    def throughput(self):
+        if self.start is None:
+            return 0.0
+        elapsed = (self.end or time.perf_counter()) - self.start
+        return (self.done - self.initial) / elapsed if elapsed > 0 else 0.0
+
+    def describe(self):
+        text = f"#{self.id} {self.operation} {os.path.basename(self.name)}: {self.state}"
+        if self.start is not None and self.operation != "verify":
+            text += f", {self.done / 1e6:.1f}"
+            if self.total:
+                text += f" de {self.total / 1e6:.1f}"
+            text += f" MB a {self.throughput() / 1e6:.2f} MB/s"
+        if self.result:
+            text += f" ({self.result})"
+        if self.error:
+            text += f" ({self.error})"
+        return text
+
+class TransferManager:
+    """
+    Ejecuta RETR, STOR, APPE, las descargas segmentadas y las verificaciones en hilos
+    propios, cada uno con su sesión paralela (FTPClient.open_session), para que la
+    conexión de control de la interfaz quede libre y las transferencias grandes no se
+    bloqueen entre sí. Guarda además los
+    listados local y remoto hasta que cambian.
+    """
+    def __init__(self, client, workers=2, local_dir="."):
+        self.client = client
+        self.workers = workers
+        self.local_dir = local_dir
+        self.jobs = {}  # id -> Job, en orden de llegada
+        self.pending = queue.Queue()
+        self.ids = count(1)
+        self.threads = []
+        self.lock = threading.Lock()
+        self.local_cache = ListingCache(8)
+        self.remote_names = None  # (directorio remoto, nombres) del último NLST
+        self.remote_stale = threading.Event()
+
+    def submit(self, operation, name, remote_dir=".", options=None):
+        """Encola una transferencia y devuelve su Job"""
+        with self.lock:
+            job = Job(next(self.ids), operation, name, remote_dir, options)
+            self.jobs[job.id] = job
+            if len(self.threads) < self.workers:
+                thread = threading.Thread(target=self.worker, daemon=True)
+                self.threads.append(thread)
+                thread.start()
+        self.pending.put(job)
+        return job
+
+    def grow(self, workers):
+        """Permite hasta workers transferencias a la vez (los hilos se crean al encolar)"""
+        with self.lock:
+            self.workers = max(self.workers, workers)
+
+    def cancel(self, job_id):
+        """Pide cancelar una transferencia; devuelve False si ya había terminado o no existe"""
+        job = self.jobs.get(job_id)
+        if job is None or not job.active():
+            return False
+        job.cancel()
+        return True
+
+    def list_jobs(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def clear_finished(self):
+        """Olvida las transferencias terminadas"""
+        with self.lock:
+            self.jobs = {i: job for i, job in self.jobs.items() if job.active()}
+
+    def worker(self):
+        session = None
+        cwd = "."
+        while True:
+            try:
+                job = self.pending.get(timeout=SESSION_IDLE)
+            except queue.Empty:
+                # Una sesión ociosa puede caducar en el servidor: se abre otra con el siguiente trabajo
+                if session:
+                    session.close()
+                    session = None
+                continue
+            if job.cancel_event.is_set():
+                job.state = CANCELLED
+                continue
+            job.state = RUNNING
+            try:
+                if session is None:
+                    session = self.client.open_session(job.remote_dir)
+                    cwd = job.remote_dir
+                if job.remote_dir != cwd:
+                    # PWD devuelve rutas relativas a la raíz de la sesión
+                    response = session.send_command("CWD", os.path.relpath(job.remote_dir, cwd))
+                    if not response.startswith("250"):
+                        raise Exception(response.strip())
+                    cwd = job.remote_dir
+                self.run(session, job)
+                job.state = DONE
+            except Exception as e:
+                if job.cancel_event.is_set():
+                    job.state = CANCELLED
+                    if (job.operation == "upload" or job.remote_created) and session:
+                        # No se deja en el servidor un archivo a medias
+                        try:
+                            session.send_command("DELE", os.path.basename(job.name))
+                        except Exception:
+                            pass
+                    elif job.operation == "append":
+                        # FTP no permite recortar el archivo remoto: se avisa de lo que pudo quedar añadido
+                        before = f"tenía {job.remote_before} bytes y " if job.remote_before is not None else ""
+                        job.error = f"el archivo remoto {before}pueden habérsele añadido hasta {job.done} bytes"
+                else:
+                    job.state = FAILED
+                    job.error = str(e)
+                if job.operation == "segmented":
+                    # El archivo reservado ya tiene el tamaño final: una descarga que se
+                    # reanudase lo daría por completo
+                    try:
+                        os.remove(os.path.join(self.client.downloads_folder, job.name))
+                    except OSError:
+                        pass
+                # Tras un error el estado de la sesión no es fiable
+                if session:
+                    session.close()
+                    session = None
+            finally:
+                job.end = time.perf_counter()
+                if job.operation in ("upload", "append"):
+                    self.remote_stale.set()
+
+    def run(self, session, job):
+        if job.operation == "download":
+            job.total = session.remote_size(job.name)
+            partial = os.path.join(session.downloads_folder, job.name)
+            if (session.transfer_type != 'A' and job.total and os.path.isfile(partial)
+                    and os.path.getsize(partial) <= job.total):
+                job.done = job.initial = os.path.getsize(partial)
+            job.start = time.perf_counter()
+            session.download(job.name, progress=job, resume=True)
+        elif job.operation == "segmented":
+            job.total = session.remote_size(job.name)
+            job.start = time.perf_counter()
+            session.download_segmented(job.name, job.options.get("segments", 4), progress=job)
+        elif job.operation == "verify":
+            job.start = time.perf_counter()
+            path = os.path.join(session.downloads_folder, job.name)
+            job.result = session.verify_file(job.name, path, job.options.get("algorithm"))
+        else:
+            if job.operation == "append":
+                response = session.send_command("SIZE", os.path.basename(job.name))
+                match = re.match(r"213 (\d+)", response)
+                job.remote_before = int(match.group(1)) if match else None
+                job.remote_created = response.startswith("550")
+            job.total = os.path.getsize(job.name)
+            job.start = time.perf_counter()
+            session.upload(job.name, progress=job, command="APPE" if job.operation == "append" else "STOR")
+
+    def local_listing(self):
+        """Archivos de la carpeta local; se vuelve a leer solo si cambió"""
+        return [name for name, is_file in self.local_cache.listing(self.local_dir) if is_file]
+
+    def invalidate_remote(self):
+        """Marca el listado remoto como desactualizado (CWD, DELE, MKD...)"""
+        self.remote_stale.set()
+
+    def remote_listing(self, remote_dir):
+        """Archivos del directorio remoto; se pide NLST solo si cambió el directorio o su contenido"""
+        if self.remote_stale.is_set() or self.remote_names is None or self.remote_names[0] != remote_dir:
+            self.remote_stale.clear()
+            self.remote_names = (remote_dir, self.client.remote_files(["*"]))
+        return self.remote_names[1]